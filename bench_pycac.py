@@ -0,0 +1,241 @@
+'''
+Benchmark dei percorsi critici di pycac.
+
+Uso:
+    python bench_pycac.py                       # set rapido
+    python bench_pycac.py --full                # fino a 1M eventi / 100 righi
+    python bench_pycac.py --out new.json --baseline old.json --threshold 1.25
+    python bench_pycac.py --filter 'voice/.*'   # solo i casi il cui nome intero corrisponde alla regex
+
+Ogni ripetizione ripete il caso fino ad almeno --min-time secondi (dopo
+una chiamata di riscaldamento) e registra il tempo per chiamata.
+I risultati (min, mediana, media in secondi e, per i casi che producono
+lilypond, la dimensione in byte) sono salvati in JSON;
+con --baseline ogni caso viene confrontato (rapporto delle mediane) e
+l'uscita è 1 se almeno un caso supera la soglia.
+Prima delle misure vengono eseguiti alcuni controlli di correttezza
+(es. stessi \\break con e senza compact); se uno fallisce l'uscita è 1.
+'''
+import gc
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import numpy as np
+import pycac
+
+# -------------------------------------------
+# - DATI (riproducibili)
+
+def make_notes(n, chords=True):
+    '''Altezze MIDI con un accordo ogni 16 eventi'''
+    rng = np.random.default_rng(0)
+    out = rng.integers(40, 90, n).tolist()
+    if chords:
+        for i in range(0, n, 16):
+            out[i] = [out[i], out[i] + 4, out[i] + 7]
+    return out
+
+def make_durs(n):
+    '''Durate regolari con un gruppo irregolare ogni 8 elementi (n eventi totali)'''
+    base, out, count = [8, 16, 16, 4, 8, 2, 8], [], 0
+    while count < n:
+        if len(out) % 8 == 7 and n - count >= 3:
+            out.append([4, [1, 1, 1]])
+            count += 3
+        else:
+            out.append(base[len(out) % len(base)])
+            count += 1
+    return out
+
+def make_chords(n):
+    '''n accordi da 3 a 5 note (Chords)'''
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(3, 6, n)
+    return pycac.Chords(pitches=rng.integers(40, 80, sizes.sum()), offsets=np.concatenate(([0], np.cumsum(sizes))))
+
+def make_vels(n):
+    return list(pycac.envelope_follower(n, shape='triangle', cycles=max(1, n // 64), min_val=20, max_val=110).astype(int))
+
+def make_exps(n):
+    keys = ['>', '.', 00, '_', 00, 'cresc', 00, 'end']
+    return [keys[i % len(keys)] for i in range(n)]
+
+# -------------------------------------------
+# - CASI
+
+def cases(full=False):
+    '''Riporta una lista di (nome, setup, funzione): funzione(setup()) viene misurata'''
+    sizes  = (1_000, 10_000, 100_000, 1_000_000) if full else (1_000, 10_000, 100_000)
+    vsizes = (1_000, 10_000, 100_000, 1_000_000) if full else (1_000, 10_000)
+    staves = (1, 10, 100) if full else (1, 10)
+    out = []
+    for n in sizes:
+        out += [
+            (f"mapPitch/{n}", lambda n=n: make_notes(n), pycac.mapPitch),
+            (f"mapDur/{n}",   lambda n=n: make_durs(n),  pycac.mapDur),
+            (f"mapVel/{n}",   lambda n=n: make_vels(n),  pycac.mapVel),
+            (f"mapExp/{n}",   lambda n=n: make_exps(n),  pycac.mapExp),
+            (f"mapExp_mask/{n}", lambda n=n: pycac.exp_masks(make_exps(n)) | pycac.exp_mask('>'), pycac.mapExp),
+            (f"l_mod/{n}",    lambda n=n: make_notes(n // 10, chords=False), lambda a, n=n: pycac.l_mod(a, n)),
+            (f"l_zero/{n}",   lambda n=n: make_notes(n // 10, chords=False), lambda a, n=n: pycac.l_zero(a, n)),
+            (f"euclidean_rhythm/{n}", lambda n=n: (n // 3, n), lambda a: pycac.euclidean_rhythm(*a)),
+            (f"chords/{n}",   lambda n=n: make_chords(n),
+             lambda c: c.transpose(3).invert().drop().clamp(40, 84).dedup_pc().to_ly()),
+            (f"chords_list/{n}", lambda n=n: make_chords(n).tolist(), pycac.mapPitch),
+            (f"envelope/{n}", lambda n=n: n,
+             lambda a: pycac.envelope_follower_smooth(list(pycac.envelope_follower(a, cycles=a // 100 + 1)))),
+        ]
+    for n in vsizes:
+        out += [
+            (f"voice/{n}",  lambda n=n: (make_notes(n), make_durs(n), make_vels(n), make_exps(n)),
+             lambda a: pycac._Voice(*a).out),
+            (f"voice_compact/{n}", lambda n=n: (make_notes(n), make_durs(n), make_vels(n), make_exps(n)),
+             lambda a: pycac._Voice(*a, compact=True).out),
+            (f"layout_uniforme/{n}", lambda n=n: pycac.Staff(make_notes(n), make_durs(n)).out,
+             lambda a: pycac.layout_uniforme(a, nbar=2)),
+        ]
+    for k in staves:
+        out += [
+            (f"staff/{k}x1000", lambda k=k: [(make_notes(1000), make_durs(1000)) for _ in range(k)],
+             lambda a: [pycac.Staff(*x).out for x in a]),
+            (f"score/{k}x1000", lambda k=k: [dict(note=make_notes(1000), dur=make_durs(1000)) for _ in range(k)],
+             lambda a: pycac.Score.from_specs(a).out),
+        ]
+    if shutil.which("lilypond"):
+        for name, compact in (("render/lilypond/1x1000", False), ("render/lilypond/compact/1x1000", True)):
+            out.append((name,
+                        lambda compact=compact: pycac.Staff(make_notes(1000), make_durs(1000), make_vels(1000),
+                                                            make_exps(1000), compact=compact).out,
+                        render))
+    return out
+
+def render(staff):
+    '''Score --> make_file in una cartella temporanea (rimossa alla fine). OUT: il .ly'''
+    with tempfile.TemporaryDirectory() as d:
+        score = pycac.Score(staff, filename=os.path.join(d, "bench"))
+        score.make_file
+        with open(score.filename + ".ly") as f:
+            return f.read()
+
+# -------------------------------------------
+# - CONTROLLI (prima delle misure)
+
+def checks():
+    '''Riporta la lista dei controlli di correttezza falliti'''
+    failed = []
+    n = 1_000
+    mat = (make_notes(n), make_durs(n), make_vels(n), make_exps(n))
+    full, comp = pycac.Staff(*mat).out, pycac.Staff(*mat, compact=True).out
+    for nbar in (1, 2, 3):                  # compact non deve spostare i \break
+        a = pycac.layout_uniforme(full, nbar=nbar).count("\\break")
+        b = pycac.layout_uniforme(comp, nbar=nbar).count("\\break")
+        if a != b or a == 0:
+            failed.append(f"layout_uniforme compact nbar={nbar}: {b} \\break invece di {a}")
+    return failed
+
+# -------------------------------------------
+# - ESECUZIONE
+
+def run(case, repeat, min_time=0.2, warmup=True):
+    '''
+    Tempo per chiamata: ogni ripetizione ripete fn finché non dura almeno
+    min_time secondi (i casi sotto il millisecondo non misurano il rumore).
+    Una chiamata di riscaldamento (cache, import, allocatore) non è contata.
+    '''
+    name, setup, fn = case
+    random.seed(0)
+    np.random.seed(0)
+    arg = setup()
+    if warmup:
+        fn(arg)
+    times, loops = [], 1
+    for _ in range(repeat):
+        random.seed(0)
+        np.random.seed(0)
+        arg = setup()
+        gcold = gc.isenabled()
+        gc.disable()                        # come timeit: niente raccolte durante la misura
+        try:
+            while True:
+                t0 = time.perf_counter()
+                for _ in range(loops):
+                    res = fn(arg)
+                elapsed = time.perf_counter() - t0
+                if elapsed >= min_time or loops >= 1_000_000:
+                    break
+                loops *= 2 if elapsed * 2 >= min_time else max(2, int(min_time / max(elapsed, 1e-9)))
+        finally:
+            if gcold:
+                gc.enable()
+        times.append(elapsed / loops)
+    out = {'min': min(times), 'median': statistics.median(times),
+           'mean': statistics.fmean(times), 'repeat': repeat, 'loops': loops}
+    if type(res) is str:                    # dimensione del lilypond generato
+        out['bytes'] = len(res)
+    return out
+
+def compare(results, baseline, threshold):
+    '''Stampa il confronto con la baseline, riporta i casi peggiorati'''
+    worse = []
+    for name, r in results.items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        ratio = r['median'] / old['median'] if old['median'] else float('inf')
+        flag = " <-- REGRESSIONE" if ratio > threshold else ""
+        print(f"{name:32s} {old['median']:10.5f} -> {r['median']:10.5f}  x{ratio:5.2f}{flag}")
+        if flag:
+            worse.append(name)
+    return worse
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark di pycac")
+    p.add_argument("--full", action="store_true", help="taglie fino a 1M eventi e 100 righi")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--filter", default=None,
+                   help="regex sul nome intero del caso (es. 'voice/.*' o 'mapPitch/1000')")
+    p.add_argument("--min-time", type=float, default=0.2,
+                   help="durata minima di ogni ripetizione in secondi (default 0.2)")
+    p.add_argument("--out", default="bench_results.json")
+    p.add_argument("--baseline", default=None, help="file JSON di un'esecuzione precedente")
+    p.add_argument("--threshold", type=float, default=1.25, help="rapporto massimo delle mediane")
+    args = p.parse_args(argv)
+
+    failed = checks()
+    for msg in failed:
+        print(f"CONTROLLO FALLITO: {msg}")
+
+    results = {}
+    pattern = re.compile(args.filter) if args.filter else None
+    for case in cases(args.full):
+        if pattern is not None and not pattern.fullmatch(case[0]):
+            continue
+        if case[0].startswith("render/"):    # lilypond: una sola chiamata, senza riscaldamento
+            results[case[0]] = run(case, 1, min_time=0, warmup=False)
+        else:
+            results[case[0]] = run(case, args.repeat, args.min_time)
+        size = f" {results[case[0]]['bytes']:>10d} byte" if 'bytes' in results[case[0]] else ""
+        print(f"{case[0]:32s} {results[case[0]]['median']:10.5f} s{size}")
+
+    meta = {'python': platform.python_version(), 'numpy': np.__version__,
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'full': args.full}
+    with open(args.out, "w") as f:
+        json.dump({'meta': meta, 'results': results}, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = compare(results, json.load(f), args.threshold)
+        return 1 if worse or failed else 0
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
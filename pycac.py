@@ -1,8 +1,29 @@
 import os
+import re
 import sys
+import json
+import glob
+import time
+import hashlib
+import asyncio
+import argparse
+import shutil
+import struct
+import bisect
+import cProfile
+import pstats
+import threading
+import tracemalloc
+import subprocess
 import numpy as np
 from math import log2 
+from fractions import Fraction
 import random
+from contextlib import contextmanager
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+from queue import Empty, Full
 from IPython.display import Image
 
 # -------------------------------------------
@@ -11,15 +32,20 @@ from IPython.display import Image
 #   • DURS (tuple di dict) = {ratio:simbolo}
 #   • VELS (tuple)         = contiene i simboli delle dinamiche in formato lilypond
 #   • EXPR (Dict)          = contiene i simboli delle espressioni in formato lilypond
+#   • ARTIC (tuple)        = tabella delle espressioni per le maschere di bit (exp_mask)
 # -------------------------------------------
 # - FUNZIONI:
-#   • mapPitch([60,64,67])        -1 = pausa, -2 = spazio (anche singolo int)
-#   • mapDur([4, 8, [4,[3,2]]])   00 = valore precedente (anche singolo int)
+#   • mapPitch([60,64,67])        -1 = pausa, -2 = spazio (anche singolo int), Chords = più accordi
+#   • mapDur([4, 8, [4,[3,2]]])   00 = valore precedente (anche singolo int), '8.' = simbolo lilypond
 #   • mapVel([127,64])            00 = senza simbolo (anche singolo int)
-#   • mapExp([">","."])           00 = senza simbolo (anche singolo int)
+#   • mapExp([">","."])           00 = senza simbolo (anche singolo int), ('>','.') = più simboli,
+#                                 int > 0 = maschera di exp_mask (anche np.ndarray)
+#   • exp_mask('>', '.', 'cresc') --> int,  exp_masks(lista) --> np.ndarray di maschere
 #   • l_mod([34,45,56], 5)        target >= list, se < riporta la lista originale
 #   • l_zero([34,00,56], 5)       target >= list, se < riporta la lista originale
 #   • dflt(None)                   None, int, lista = crea lista o aggiunge 'zero' alla fine
+#   • instrument(profile=False, memory=False, hooks=())
+#                                 context manager: tempi per fase e contatori --> Stats
 # -------------------------------------------
 # - CLASSI:
 #   • _Map(note=[60], dur=[4], vel=[64], exp=[">"])
@@ -31,6 +57,8 @@ from IPython.display import Image
 
 #   • _Print(filename="score", format="pdf", version="2.24.3")
 #                       .print_out --> stampa la stringa nel terminale
+#                       .make_ly   --> genera solo il file .ly (scritto a blocchi)
+#                       .iter_ly() --> generatore di blocchi del file .ly, .write(f) --> su un file aperto
 #                       .make_file --> genera tre files
 #
 #   • _Voice(note=60, dur=None, vel=None, exp=None,
@@ -41,12 +69,12 @@ from IPython.display import Image
 #
 #   • Staff(voice=lista di Voice,
 #           key=None, t_sig=None, clef=None,
-#           i_name=None, i_short=None, i_midi=None,
+#           i_name=None, i_short=None, i_midi=None, compact=False,
 #           filename="score", format="pdf", version="2.24.3") --> ereditati dal _Print 
 #                       .out       --> genera una stringa in output
 #                       .print_out --> stampa la stringa nel terminale
 #                       .make_file --> genera tre files
-#   • Score(staff=Nlista di Staff,
+#   • Score(staff=Nlista di Staff (tuple o generatore: scritti uno alla volta),
 #           staff_size=None, indent=None, s_indent=None,
 #           title=None, composer=None,
 #           size="a4landscape", margins=(10,10,10,10),
@@ -54,6 +82,40 @@ from IPython.display import Image
 #                       .out       --> genera una stringa in output
 #                       .print_out --> stampa la stringa nel terminale
 #                       .make_file --> genera tre files
+#                       .make_chunks(n) --> compila in parallelo n sezioni e le unisce
+#                       .make_project(dir) --> un frammento .ly per Staff + \include, ricompila solo se cambia
+#   • Score.from_specs(specs=lista di dict (argomenti di Staff), workers=None, ...)
+#                       --> costruisce gli Staff in parallelo (processi) e crea la Score
+# -------------------------------------------
+# - RIGA DI COMANDO:
+#   • python -m pycac render jobs.jsonl --out-dir out --workers 8
+#                       --> compila molte specifiche JSON con cache e manifest
+#   • python -m pycac watch script.py -i dati.json   (oppure watch(script, inputs))
+#                       --> riesegue lo script in un processo caldo e ricompila solo i .ly cambiati
+# -------------------------------------------
+# - ARCHIVI:
+#   • save_material("gen.npz" | "gen_dir", _Voice | Staff | Score | lista di dict)
+#   • load_material(path) --> Material (colonnare, lazy, memory-mapped se cartella)
+#                       [i] / [a:b] --> argomenti di Staff, .score(...) --> Score
+# -------------------------------------------
+# - TEMPO REALE:
+#   • midi_events(_Voice | Staff | Score | lista di dict, tempo=60) --> [(secondi, (status, nota, vel))]
+#   • Player(materiale, tempo=60, sinks=[callback | asyncio.Queue | VirtualPort], lookahead=0.05)
+#                       await .play() --> metriche di latenza
+# -------------------------------------------
+# - PARSER:
+#   • parse_ly(testo) / read_ly(path) --> {'title', 'composer', 'staves': [argomenti di Staff]}
+#                       (lilypond generato da _Voice/Staff/Score)
+# -------------------------------------------
+# - ACCORDI:
+#   • Chords([[60,64,67], [62,65,69]]) o Chords(pitches=..., offsets=...)
+#                       .transpose(n) .invert(k) .drop(n) .spread() .clamp(lo, hi) .dedup_pc()
+#                       .to_ly() --> simboli lilypond, .tolist() --> liste; vale come note di Staff
+# -------------------------------------------
+# - RICERCA CON VINCOLI:
+#   • search(length, domain, [Intervals([1,2]), Bounds(48,84), NoRepeatPC(6), Density(3,8)],
+#            workers=None, limit=None, seed=None) --> generatore di sequenze
+#                       vincoli: Constraint(prefix, cand) --> maschera numpy
 
 # -------------------------------------------
 # - COSTANTI
@@ -131,8 +193,149 @@ EXPR = {
 
     00:          '',        # nessuna espressione
     '': '',
-    '!':'\\!',
 }
+# bit i della maschera = ARTIC[i]. Ordine fisso (maschere salvate con save_material):
+# le nuove espressioni di EXPR vanno aggiunte in fondo
+ARTIC = ('>', '^', '!', '.', '_', '-', 'tie', 'expr', 'tr', 'm', 'cor', 'turn', 'arpeggio',
+         'glissando', 'cresc', 'dim', 'end', 'breathe', 'upbow', 'downbow', 'harmonic',
+         'flageolet', 'pizzicato', 'bartokPizz')
+ARTIC_BIT = {k: 1 << i for i, k in enumerate(ARTIC)}
+# -------------------------------------------
+# - STRUMENTAZIONE:
+#   fasi: mapPitch, mapDur, mapVel, mapExp, normalize (_Map), voice, staff, score,
+#         build (from_specs), layout (layout_uniforme), write (.ly), lilypond,
+#         split/merge (make_chunks)
+#   contatori: events (eventi mappati), bytes (scritti nei .ly), compact_bytes (risparmiati da compact)
+
+class Stats:
+    '''
+    Statistiche raccolte da instrument()
+        .timers   --> {fase: [chiamate, secondi]}
+        .counters --> {nome: valore}
+        .profile  --> pstats.Stats (se profile=True)
+        .memory   --> (picco in bytes, allocazioni principali) (se memory=True)
+        .as_dict  --> dizionario serializzabile (json)
+    '''
+    def __init__(self, hooks=()):
+        self.timers   = {}
+        self.counters = {}
+        self.profile  = None
+        self.memory   = None
+        self.hooks    = list(hooks)
+        self._lock    = threading.Lock()   # lilypond gira anche in thread paralleli
+
+    def add(self, stage, seconds, counts=None):
+        with self._lock:
+            t = self.timers.setdefault(stage, [0, 0.0])
+            t[0] += 1
+            t[1] += seconds
+            if counts:
+                for k, v in counts.items():
+                    self.counters[k] = self.counters.get(k, 0) + v
+        for fn in self.hooks:
+            fn(stage, seconds, counts or {})
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, timers, counters):
+        '''Aggiunge timers e contatori raccolti in un processo del pool (senza hooks)'''
+        with self._lock:
+            for stage, (calls, seconds) in timers.items():
+                t = self.timers.setdefault(stage, [0, 0.0])
+                t[0] += calls
+                t[1] += seconds
+            for k, v in counters.items():
+                self.counters[k] = self.counters.get(k, 0) + v
+
+    @property
+    def as_dict(self):
+        out = {'timers':   {k: {'calls': v[0], 'seconds': v[1]} for k, v in self.timers.items()},
+               'counters': dict(self.counters)}
+        if self.profile is not None:
+            rows = sorted(self.profile.stats.items(), key=lambda x: x[1][3], reverse=True)[:25]
+            out['profile'] = [{'function': f"{f[0]}:{f[1]}({f[2]})", 'calls': v[1],
+                               'tottime': v[2], 'cumtime': v[3]} for f, v in rows]
+        if self.memory is not None:
+            out['memory'] = {'peak': self.memory[0],
+                             'top': [{'where': str(st.traceback), 'size': st.size, 'count': st.count}
+                                     for st in self.memory[1]]}
+        return out
+
+_STATS = None   # Stats attive, None = strumentazione disattivata
+_CAPTURE = None # watch: lista dei .ly intercettati nel processo di lavoro
+
+def _tic():
+    '''Inizio di una fase (None se la strumentazione è disattivata)'''
+    return time.perf_counter() if _STATS is not None else None
+
+def _toc(stage, t0, **counts):
+    '''Fine di una fase iniziata con _tic()'''
+    if t0 is not None and _STATS is not None:
+        _STATS.add(stage, time.perf_counter() - t0, counts)
+
+def _count(name, n=1):
+    if _STATS is not None:
+        _STATS.count(name, n)
+
+@contextmanager
+def _collect(on=True):
+    '''
+    Nei processi di un pool: Stats locale (se on) da rimandare al processo
+    principale come (timers, counters) e aggiungere con Stats.merge
+    '''
+    global _STATS
+    if not on:
+        yield None
+        return
+    prev, _STATS = _STATS, Stats()
+    try:
+        yield _STATS
+    finally:
+        _STATS = prev
+
+@contextmanager
+def instrument(profile=False, memory=False, hooks=()):
+    """
+    Attiva la strumentazione di pycac nel blocco with.
+
+    Args:
+        profile (bool): Cattura anche un profilo cProfile
+        memory (bool): Traccia le allocazioni con tracemalloc (se il chiamante
+                       ha già avviato tracemalloc la sessione resta attiva)
+        hooks (list): Callback fn(fase, secondi, contatori) a fine di ogni fase
+
+    Returns:
+        Stats: Riempito all'uscita dal blocco
+
+    Esempio:
+        with instrument() as st:
+            Score(Staff(note=list(range(60, 72)), dur=8).out).make_file
+        print(st.as_dict)
+    """
+    global _STATS
+    prev, _STATS = _STATS, Stats(hooks)
+    stats = _STATS
+    prof = cProfile.Profile() if profile else None
+    started = memory and not tracemalloc.is_tracing()  # una sessione già attiva resta al chiamante
+    if started:
+        tracemalloc.start()
+    if prof is not None:
+        prof.enable()
+    try:
+        yield stats
+    finally:
+        if prof is not None:
+            prof.disable()
+            stats.profile = pstats.Stats(prof)
+        if memory:
+            snap = tracemalloc.take_snapshot()
+            stats.memory = (tracemalloc.get_traced_memory()[1], snap.statistics('lineno')[:10])
+            if started:
+                tracemalloc.stop()
+        _STATS = prev
+
 # -------------------------------------------
 # - FUNZIONI:
 
@@ -140,14 +343,16 @@ def mapPitch(a):
         '''
         Midinote --> Simboli Lilypond
         0-127 -1 = pausa, -2 = spazio, 00 = valore precedente
-        IN:  list (int) 
+        IN:  list (int/list 2D/Chords) 
         OUT: list (string) 
         '''
         if type(a) is not list:
             a = [a]                     # Casting
         out = []
         for i in a:
-            if type(i) is list:         # se accordo
+            if isinstance(i, Chords):   # se progressione di accordi
+                out.extend(i.to_ly())
+            elif type(i) is list:       # se accordo
                 x = '< '
                 for n in i:
                     if n == -1:
@@ -246,6 +451,8 @@ def mapDur(a):
                         sudd.append(DURS[8][round((1/i[0] / sum(i[1])) * d,5)])
                     irr.append(sudd)
                     out.append(irr)
+            elif type(i) is str:             # se simbolo lilypond ('8.', '4~16')
+                out.append(i)
             else:
                 if i == 00:                  # se 00 valore precedente 
                     out.append('')         
@@ -317,16 +524,93 @@ def mapExp(a):
         ''' 
         Simboli --> Simboli Lilypond
         00 = valore precedente
-        IN:  list (string)
+        IN:  list (string/tuple o list/int maschera) o np.ndarray di maschere
         OUT: list (string) 
         '''
+        if isinstance(a, np.ndarray):
+            return _masks_ly(a)
         if type(a) is not list:
             a = [a]             # Casting
         out = []                          
         for i in a:                   
-            out.append(EXPR[i])                    
+            try:
+                out.append(EXP_LY[i])       # chiavi, maschere e tuple già viste
+            except (KeyError, TypeError):
+                if isinstance(i, np.ndarray):   # maschere (vale come len(i) eventi)
+                    out.extend(_masks_ly(i))
+                elif type(i) in (tuple, list):  # più simboli sulla stessa nota (liste da JSON)
+                    i = tuple(i)
+                    out.append(EXP_LY.setdefault(i, ''.join(EXPR[k] for k in i)))
+                elif type(i) is str:
+                    out.append(EXPR[i])
+                else:                           # maschera di bit
+                    out.append(_mask_ly(i))
         return out 
 
+# -------------------------------------------
+# Maschere di bit: più espressioni sulla stessa nota in un int
+# (bit i = ARTIC[i]). Si combinano con | anche su array numpy:
+#     exp_masks(['>', '.', 00]) | exp_mask('cresc')
+# La stringa di ogni maschera è calcolata una volta (EXP_LY).
+
+EXP_LY = dict(EXPR)     # cache di mapExp: chiavi di EXPR, maschere (int) e tuple
+
+def _mask_ly(m):
+    '''Maschera --> stringa lilypond (espressioni nell'ordine di ARTIC), in cache'''
+    m = int(m)
+    if m not in EXP_LY:
+        if m < 0 or m >> len(ARTIC):
+            raise ValueError(f"maschera di espressioni non valida: {m}")
+        EXP_LY[m] = ''.join(EXPR[k] for i, k in enumerate(ARTIC) if m >> i & 1)
+    return EXP_LY[m]
+
+def _masks_ly(a):
+    '''Array di maschere --> lista di stringhe (una conversione per valore distinto)'''
+    u, inv = np.unique(np.asarray(a, dtype=np.int64), return_inverse=True)
+    lut = [_mask_ly(m) for m in u.tolist()]
+    return [lut[i] for i in inv.ravel().tolist()]
+
+def exp_mask(*keys):
+    '''
+    Espressioni --> maschera di bit
+
+    Args:
+        *keys: Chiavi di EXPR, tuple (o liste) di chiavi o maschere (int)
+
+    Returns:
+        int
+
+    Esempio:
+        exp_mask('>', '.', 'cresc')        # accento + staccato + inizio crescendo
+    '''
+    m = 0
+    for k in keys:
+        if type(k) is str:
+            m |= ARTIC_BIT[k] if k else 0
+        elif type(k) in (tuple, list):
+            m |= exp_mask(*k)
+        else:
+            m |= int(k)
+    return m
+
+def exp_masks(a):
+    '''
+    Lista di espressioni (chiavi, tuple o liste, maschere, 00) --> np.ndarray di maschere (int64)
+    Da combinare con | (es. exp_masks(accenti) | exp_masks(hairpin))
+    '''
+    if isinstance(a, np.ndarray):
+        return a.astype(np.int64)
+    if type(a) is not list:
+        a = [a]
+    a = [tuple(k) if type(k) is list else k for k in a]
+    cache = {}
+    return np.fromiter((cache[k] if k in cache else cache.setdefault(k, exp_mask(k)) for k in a),
+                       dtype=np.int64, count=len(a))
+
+def exp_keys(m):
+    '''Maschera --> tuple di chiavi di EXPR (nell'ordine di ARTIC)'''
+    return tuple(k for i, k in enumerate(ARTIC) if int(m) >> i & 1)
+
 # a = '.'
 # a = mapExp(a)
 # print(a)
@@ -429,7 +713,7 @@ def dflt(a):
         out = [0,'zero']                 # ---> mette default
     elif type(a) is not list:          # SE è int singolo
         out = [a,'zero']                 # --> crea una lista
-    elif a[-1] != 'mod' and a[-1] != 'zero': # SE non specifica il modo
+    elif type(a[-1]) is not str or a[-1] not in ('mod', 'zero'): # SE non specifica il modo
         a.append('zero')                     # --> lo mette di default
         out = a
     else:
@@ -455,6 +739,35 @@ def getdurmax(note,dur,vel,exp):
         else: idx += 1                    # se regolare
     return max(len(note),idx,len(vel),len(exp))  # trova il size max
 
+def _lilypond(filename, format="pdf", quiet=False):
+    '''
+    Compila filename.ly con lilypond.
+    OUT: (returncode, secondi, log) -- log = stderr solo se quiet
+    '''
+    if _CAPTURE is not None:                    # watch(): compila il processo principale
+        for c in _CAPTURE:
+            if c['file'] == filename:
+                c['format'], c['render'] = format, True
+                break
+        else:
+            _CAPTURE.append({'file': filename, 'format': format, 'text': None, 'render': True})
+        return 0, 0.0, ""
+    cmd = ["lilypond", "-dresolution=300", "-dpixmap-format=png16m",
+           f"--format={format}", f"--output={filename}", f"{filename}.ly"]
+    t0 = time.perf_counter()
+    t1 = _tic()
+    try:
+        if quiet:
+            res = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        else:
+            res = subprocess.run(cmd)
+    except FileNotFoundError:
+        print("lilypond: comando non trovato (aggiungilo al PATH)", file=sys.stderr)
+        _toc('lilypond', t1)
+        return 127, time.perf_counter() - t0, ""
+    _toc('lilypond', t1)
+    return res.returncode, time.perf_counter() - t0, res.stderr if quiet else ""
+
 # -------------------------------------------
 # - CLASSI:
 
@@ -482,10 +795,19 @@ class _Map:
         self.vel  = [self.vel[0:-1], self.vel[-1]]
         self.exp  = [self.exp[0:-1], self.exp[-1]]
 
+        t0 = _tic()
         self.note[0] = mapPitch(self.note[0])  # mapping con liste senza 'mod o 'zero'
+        _toc('mapPitch', t0)
+        t0 = _tic()
         self.dur[0]  = mapDur(self.dur[0]) 
+        _toc('mapDur', t0)
+        t0 = _tic()
         self.vel[0]  = mapVel(self.vel[0]) 
+        _toc('mapVel', t0)
+        t0 = _tic()
         self.exp[0]  = mapExp(self.exp[0]) 
+        _toc('mapExp', t0)
+        t0 = _tic()
 
         self.max  = getdurmax(self.note[0],self.dur[0],self.vel[0],self.exp[0]) # trova il size max delle liste
                                                                                 # per normalizzazione
@@ -493,6 +815,7 @@ class _Map:
         self.dur  = selmode(self.dur, self.max)  # in due modalità 'mod' oppure 'zero'
         self.vel  = selmode(self.vel, self.max)
         self.exp  = selmode(self.exp, self.max)
+        _toc('normalize', t0, events=self.max)
  
 # p = [60,45,56,[67,78,89],67,56,67]
 # d = [4,  [4,[1,1,1]],4,4,'zero']
@@ -533,18 +856,104 @@ class _Print:
         self.outo = f"\n\\version \"{self.version}\"\n\\language \"english\"\n\n{self.outstring}"
         print(self.outo)
     
+    def iter_ly(self):
+        '''
+        Genera il file .ly a blocchi (intestazione + blocchi delle sottoclassi):
+        ''.join(self.iter_ly()) è il testo scritto da make_ly
+        '''
+        chunks = self._ly_chunks()      # eventuali errori subito, non a metà scrittura
+        return chain((f"\n\\version \"{self.version}\"\n\\language \"english\"\n",), chunks)
+
+    def _ly_chunks(self):
+        yield self.outstring
+
+    def write(self, f):
+        '''
+        Scrive il codice lilypond a blocchi su f (file o oggetto con .write)
+        senza costruire l'intero documento. OUT: caratteri scritti
+        '''
+        n = 0
+        for chunk in self.iter_ly():
+            f.write(chunk)
+            n += len(chunk)
+        return n
+
+    def _write(self, h=None):
+        '''Scrive filename.ly a blocchi; h (hashlib) viene aggiornato con il testo'''
+        if _CAPTURE is not None:                # watch(): il testo va al processo principale
+            _CAPTURE.append({'file': self.filename, 'format': self.format,
+                             'text': ''.join(self.iter_ly()), 'render': False})
+            return
+        t0 = _tic()
+        n = 0
+        chunks = self.iter_ly()
+        with open(self.filename + ".ly", "w") as f:
+            for chunk in chunks:
+                f.write(chunk)
+                n += len(chunk)
+                if h is not None:
+                    h.update(chunk.encode())
+        _toc('write', t0, bytes=n)
+
+    @property
+    def make_ly(self):
+        '''
+        Genera solo il file .ly (senza compilarlo), scritto a blocchi
+        '''
+        self._write()
+
     @property
     def make_file(self):
         '''
         Genera tre files: .ly .format e .midi
         '''
-        self.outo = f"\n\\version \"{self.version}\"\n\\language \"english\"\n{self.outstring}"
-        f = open(self.filename + ".ly", "w")  # crea un file di testo...
-        f.write(self.outo)                    # lo scrive...
-        f.close()                             # lo chiude in python
+        self.make_ly
+        _lilypond(self.filename, self.format)
 
-        cmd = f"lilypond -dresolution=300 -dpixmap-format=png16m --format={self.format} --output={self.filename} {self.filename}.ly"
-        os.system(cmd)   
+def _compact(note, dur, vel, exp):
+    '''
+    Compattazione (run-length) dei simboli già mappati di una voce:
+        • durata uguale alla precedente --> omessa (solo se l'evento ha un'altezza
+          e il seguente non è una durata senza altezza)
+        • dinamica uguale alla precedente --> omessa (se nel frattempo non inizia una forcella)
+        • \\! senza forcella aperta o insieme a una dinamica --> omesso
+    Il significato musicale (e il midi) non cambia.
+    OUT: (dur, vel, exp, byte risparmiati)
+    '''
+    dur = [[d[0], list(d[1])] if type(d) == list else d for d in dur]
+    vel, exp = list(vel), list(exp)
+    state = {'dur': None, 'dyn': None, 'open': False, 'saved': 0, 'k': -1}
+
+    def event(d):
+        state['k'] += 1
+        k = state['k']
+        # "d' 8" = d'8: la durata resta se l'evento seguente non ha altezza
+        if d and note[k] and '~' not in d and d == state['dur'] and (k + 1 == len(note) or note[k + 1]):
+            state['saved'] += len(d)
+            d = ''
+        elif d:
+            state['dur'] = d.rsplit('~', 1)[-1]            # '4~16' --> 16
+        v, e = vel[k], exp[k]
+        if v and v == state['dyn']:
+            state['saved'] += len(v)
+            vel[k] = ''
+        elif v:
+            state['dyn'], state['open'] = v, False        # la dinamica chiude la forcella
+        if '\\!' in e and not state['open']:
+            state['saved'] += e.count('\\!') * 2
+            e = exp[k] = e.replace('\\!', '')
+        if '\\<' in e or '\\>' in e:
+            state['dyn'], state['open'] = None, True
+        elif '\\!' in e:
+            state['open'] = False
+        return d
+
+    for i, d in enumerate(dur):
+        if type(d) == list:
+            d[1] = [event(x) for x in d[1]]
+        else:
+            dur[i] = event(d)
+    return dur, vel, exp, state['saved']
 
 class _Voice(_Print):
     '''
@@ -554,36 +963,42 @@ class _Voice(_Print):
         • durate ([4, [4,[3,1]]])  oppure int
         • velocity ([64])          oppure int 
         • espressioni  (['>''])    oppure int
+        • compact (bool: omette durate e dinamiche ripetute, vedi _compact)
     OUT: un'espressione musicale di lilypond (stringa)
     '''
     def __init__(self,
-                 note=60,dur=None,vel=None,exp=None,
+                 note=60,dur=None,vel=None,exp=None,compact=False,
                  filename="score", format="pdf", version="2.24.3"
                  ):
         super().__init__(filename,format,version)
+        self.material = dict(note=note, dur=dur, vel=vel, exp=exp)  # ingressi (save_material)
 
         ins = _Map(note,dur,vel,exp)    # Crea liste della stessa lunghezza
+        t0 = _tic()
         self.note = ins.note
         self.dur  = ins.dur 
         self.vel  = ins.vel 
         self.exp  = ins.exp 
-        self.music   = ''
+        if compact:
+            self.dur, self.vel, self.exp, saved = _compact(self.note, self.dur, self.vel, self.exp)
+            _count('compact_bytes', saved)
         self.id      = -1
         
+        parts = []                              # un solo join alla fine
         for i in self.dur:
             if type(i)==list:
-                self.irr = ''
-                self.irr = self.irr + i[0] + ' { '
+                parts.append(i[0] + ' { ')
                 for n in i[1]:
                     self.id += 1 
-                    self.irr = self.irr + self.note[self.id] + n + self.vel[self.id] + self.exp[self.id] + ' '             
-                self.irr = self.irr + '} '
-                self.music = self.music + self.irr                            
+                    parts.append(self.note[self.id] + n + self.vel[self.id] + self.exp[self.id] + ' ')
+                parts.append('} ')
             else:                                  
                 self.id += 1                            
-                self.music = self.music + self.note[self.id] + i + self.vel[self.id] + self.exp[self.id] + ' '     
+                parts.append(self.note[self.id] + i + self.vel[self.id] + self.exp[self.id] + ' ')
+        self.music = ''.join(parts)
                   
         self.outstring = f"{{ {self.music} }}"
+        _toc('voice', t0)
         
     @property
     def out(self):
@@ -616,15 +1031,21 @@ class Staff(_Print):
         • nome abbreviato ('Vl')
         • nome MIDI ('violino')
           https://lilypond.org/doc/v2.23/Documentation/notation/midi-instruments
+        • compact (bool: omette durate e dinamiche ripetute in ogni voce)
     OUT: un'espressione musicale di lilypond (stringa)
     '''
     def __init__(self,
                  note=60,dur=None,vel=None,exp=None,              # --> le stesse di _Voice
                  key=None,t_sig=None,clef=None,
-                 i_name=None,i_short=None,i_midi=None,
+                 i_name=None,i_short=None,i_midi=None,compact=False,
                  filename="score", format="pdf", version="2.24.3" # ereditate da _Print
                  ):
         super().__init__(filename,format,version)
+        self.material = dict(note=note, dur=dur, vel=vel, exp=exp,   # ingressi (save_material)
+                             key=key, t_sig=t_sig, clef=clef,
+                             i_name=i_name, i_short=i_short, i_midi=i_midi)
+        if compact:
+            self.material['compact'] = True
 
         self.voice = []
         if type(note) == tuple:
@@ -634,11 +1055,12 @@ class Staff(_Print):
                 voicevel = None if vel is None else vel[i]
                 voiceexp = None if exp is None else exp[i]
     
-                a = _Voice(note[i],voicedur,voicevel,voiceexp)
+                a = _Voice(note[i],voicedur,voicevel,voiceexp,compact)
                 self.voice.append(a.out)
 
-        else: self.voice.append(_Voice(note,dur,vel,exp).out)
+        else: self.voice.append(_Voice(note,dur,vel,exp,compact).out)
 
+        t0 = _tic()
         self.multivoice = ""
         self.items = len(self.voice)
         self.cnt = 0
@@ -663,6 +1085,7 @@ class Staff(_Print):
         self.i_midi  = f"\n\t\t\t\t  midiInstrument=\"{i_midi}\"" if i_midi is not None else '\n\t\t\t\t  midiInstrument=\"acoustic grand\"'
                       
         self.outstring = f"\t\t\\new Staff \\with {{{self.i_name}{self.i_short}{self.i_midi}{self.clef}\n\t\t\t\t  }}\n\t\t\t{self.vseq}"
+        _toc('staff', t0)
         
     @property
     def out(self):
@@ -675,12 +1098,69 @@ e = (['.', 00, 00, '>','mod'], 00, 00, 00)
 
 a = Staff(p,d,v,e).make_file
  """
+
+# ============================================================
+# COSTRUZIONE PARALLELA DEGLI STAFF (Score.from_specs)
+# Gli np.ndarray numerici grandi passano ai processi tramite shared memory
+# (solo il descrittore viene serializzato), il resto viene serializzato.
+
+SHM_MIN = 1 << 16   # numero minimo di elementi per usare la shared memory
+
+class _ShmRef:
+    '''Descrittore di un array copiato in un blocco di shared memory'''
+    __slots__ = ('name', 'shape', 'dtype')
+
+    def __init__(self, name, shape, dtype):
+        self.name  = name
+        self.shape = shape
+        self.dtype = dtype
+
+def _shm_pack(value, blocks):
+    '''
+    Sostituisce gli np.ndarray grandi (anche dentro tuple di voci)
+    con un _ShmRef. I blocchi creati vengono aggiunti a blocks.
+    '''
+    if type(value) == tuple:                 # più voci per staff
+        return tuple(_shm_pack(v, blocks) for v in value)
+    if isinstance(value, np.ndarray) and value.dtype != object and value.size >= SHM_MIN:
+        shm = shared_memory.SharedMemory(create=True, size=value.nbytes)
+        blocks.append(shm)
+        np.ndarray(value.shape, value.dtype, buffer=shm.buf)[...] = value
+        return _ShmRef(shm.name, value.shape, value.dtype.str)
+    return value
+
+def _shm_unpack(value):
+    '''Ricostruisce liste python da _ShmRef e np.ndarray'''
+    if type(value) == tuple:
+        return tuple(_shm_unpack(v) for v in value)
+    if isinstance(value, _ShmRef):
+        shm = shared_memory.SharedMemory(name=value.name)
+        try:
+            out = np.ndarray(value.shape, value.dtype, buffer=shm.buf).tolist()
+        finally:
+            shm.close()
+        return out
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+def _build_staff(spec):
+    '''Costruisce uno Staff da una specifica (dict) e riporta la stringa lilypond'''
+    spec = {k: _shm_unpack(v) for k, v in spec.items()}
+    return Staff(**spec).out
+
+def _build_staff_stats(spec):
+    '''_build_staff in un processo del pool con instrument() attivo: (stringa, timers, contatori)'''
+    with _collect() as st:
+        out = _build_staff(spec)
+    return out, st.timers, st.counters
+
 class Score(_Print):
     '''
         Definisce le caratteristiche della partitura. 
         Formattando gli outputs delle classi precedenti. 
         Di default crea uno StaffGroup.
-        IN: • staff (tuple di output di una o più istane di Staff)
+        IN: • staff (tuple o lista di output di una o più istane di Staff, oppure un generatore)
             • staff_size (in mm)
             • indent (rientro in mm)
             • s_indent (short indent in mm)
@@ -699,11 +1179,19 @@ class Score(_Print):
                  filename="score", format="pdf", version="2.24.3"    # ereditati da _Print
                 ):
         super().__init__(filename,format,version)
+        self.options = dict(staff_size=staff_size, indent=indent, s_indent=s_indent,
+                            title=title, composer=composer, size=size, margins=margins,
+                            filename=filename, format=format, version=version)
+        self.material = None    # specifiche degli Staff se creata con from_specs (save_material)
 
-        if type(staff) == tuple:
-            self.staff = staff
-        else: 
+        self.lazy = False
+        if type(staff) == str: 
             self.staff = [staff]
+        elif iter(staff) is staff:  # generatore di Staff: scritti uno alla volta (iter_ly, make_ly)
+            self.staff = staff
+            self.lazy  = True
+        else:                   # tuple, lista o altra sequenza: riutilizzabile
+            self.staff = staff
 
         self.staff_size = f"\n\t#(layout-set-staff-size {staff_size})" if staff_size is not None else ""
         self.indent     = f"\n\tindent = {indent}" if indent is not None else ""
@@ -721,15 +1209,235 @@ class Score(_Print):
         self.page = f'''\\header {{{self.title}{self.composer}\n\ttagline=\"\"\n\t}}
         {self.custom}\n\\paper {{{self.size}{self.margins}\n\t}}'''
 
-        self.multistaff = ""
-        for i in self.staff:
-            self.multistaff = self.multistaff + i + "\n"
-        self.outstring = f'''{self.page}\n\n\\score {{\n\t\\new StaffGroup\n\t\t<<\n{self.multistaff}\t\t>>\n{self.layout}\n\n\t\\midi {{ }}\n\t}}'''
+        self.head = f'''{self.page}\n\n\\score {{\n\t\\new StaffGroup\n\t\t<<\n'''
+        self.tail = f'''\t\t>>\n{self.layout}\n\n\t\\midi {{ }}\n\t}}'''
+        if not self.lazy:
+            self._build()
+
+    def _build(self):
+        t0 = _tic()
+        self.multistaff = "".join(i + "\n" for i in self.staff)
+        self.outstring = self._wrap(self.multistaff)
+        _toc('score', t0)
+
+    def __getattr__(self, name):
+        if name in ('outstring', 'multistaff') and self.__dict__.get('lazy'):
+            self.staff, self.lazy = tuple(self._staves()), False   # costruisce il testo completo
+            self._build()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def _staves(self):
+        '''Staff in ordine (un generatore può essere letto una sola volta)'''
+        if self.lazy:
+            if self.__dict__.get('consumed'):
+                raise RuntimeError("Score: il generatore di Staff è già stato letto")
+            self.consumed = True
+        return self.staff
+
+    def _wrap(self, multistaff):
+        '''Intestazione, StaffGroup e blocchi layout/midi attorno agli Staff'''
+        return self.head + multistaff + self.tail
+
+    def _ly_chunks(self):
+        '''Intestazione, ogni Staff e chiusura: in memoria un solo Staff alla volta'''
+        staves = self._staves()         # RuntimeError prima di aprire il file
+        def chunks():
+            yield self.head
+            for staff in staves:
+                yield staff
+                yield "\n"
+            yield self.tail
+        return chunks()
 
     @property
     def out(self):
         return self.outstring
 
+    @classmethod
+    def from_specs(cls, specs, workers=None, chunksize=None, **kwargs):
+        '''
+        Costruisce gli Staff a partire da specifiche e crea la Score.
+        Con workers > 1 gli Staff vengono costruiti in un pool di processi
+        e riassemblati nell'ordine delle specifiche.
+
+        Args:
+            specs (list): Lista di dict con gli argomenti di Staff
+                          (note, dur, vel, exp, key, clef, i_name, ...).
+                          I parametri possono essere np.ndarray: se grandi
+                          (>= SHM_MIN elementi) passano in shared memory.
+            workers (int): Numero di processi (None o 1 = sequenziale)
+            chunksize (int): Specifiche per task (default automatico)
+            **kwargs: Argomenti di Score (title, composer, format, ...)
+
+        Returns:
+            Score
+
+        Esempio:
+            specs = [dict(note=np.arange(60, 72), dur=8, i_name=f"Vl {n}") for n in range(64)]
+            Score.from_specs(specs, workers=8, title="Tutti").make_file
+        '''
+        specs = list(specs)
+        t0 = _tic()
+        if workers is None or workers <= 1 or len(specs) < 2:
+            staves = [_build_staff(s) for s in specs]
+        else:
+            if chunksize is None:
+                chunksize = max(1, len(specs) // (workers * 4))
+            blocks = []
+            try:
+                packed = [{k: _shm_pack(v, blocks) for k, v in s.items()} for s in specs]
+                with ProcessPoolExecutor(max_workers=workers) as ex:
+                    if _STATS is None:
+                        staves = list(ex.map(_build_staff, packed, chunksize=chunksize))
+                    else:                   # fasi dei processi --> instrument() del principale
+                        staves = []
+                        for out, timers, counters in ex.map(_build_staff_stats, packed, chunksize=chunksize):
+                            staves.append(out)
+                            _STATS.merge(timers, counters)
+            finally:
+                for shm in blocks:
+                    shm.close()
+                    shm.unlink()
+        _toc('build', t0)
+        score = cls(staff=tuple(staves), **kwargs)
+        score.material = specs
+        return score
+
+    def make_chunks(self, n=4, time_num=4, time_den=4, workers=None):
+        '''
+        Divide la partitura in n sezioni sulle stanghette, le compila
+        in parallelo e unisce i risultati in filename.pdf e filename.midi.
+        Ogni sezione riporta il numero di battuta e l'ultimo \\clef, \\key
+        e \\time incontrati in ogni voce. Titolo e compositore solo nella prima.
+
+        Args:
+            n (int): Numero di sezioni
+            time_num/time_den (int): Metro usato per contare le battute (costante)
+            workers (int): Compilazioni lilypond in parallelo (default = n)
+
+        Returns:
+            dict: {'chunks': [{'chunk', 'file', 'bars', 'seconds', 'returncode', 'log'}],
+                   'pdf': file unito o None, 'midi': file unito o None, 'seconds': totale}
+                  Per formati diversi da pdf le pagine restano nei file delle sezioni.
+        '''
+        t0 = time.perf_counter()
+        t1 = _tic()
+        staves = [_split_staff(i, time_num, time_den) for i in self._staves()]
+        nbars = max([s[0] for s in staves] + [1])
+        starts = set()
+        for k in range(n):              # una nota che attraversa la stanghetta sposta il taglio avanti
+            bar = k * nbars // n
+            while bar < nbars and not _cut_ok(staves, bar):
+                bar += 1
+            if bar < nbars:
+                starts.add(bar)
+        starts = sorted(starts)
+        measure = Fraction(time_num, time_den)
+        chunks = []
+        for k, bar in enumerate(starts):
+            end = starts[k+1] if k+1 < len(starts) else nbars
+            opts = dict(self.options, filename=f"{self.filename}-{k:03d}")
+            if k > 0:
+                opts['title'] = opts['composer'] = None
+            part = tuple(_chunk_staff(st, bar, end) for st in staves)
+            Score(part, **opts).make_ly
+            chunks.append({'chunk': k, 'file': opts['filename'], 'bars': (bar+1, end)})
+        _toc('split', t1)
+
+        def job(c):
+            c['returncode'], c['seconds'], c['log'] = _lilypond(c['file'], self.format, quiet=True)
+            return c
+        with ThreadPoolExecutor(max_workers=workers or len(chunks)) as ex:
+            chunks = list(ex.map(job, chunks))
+
+        t1 = _tic()
+        ok = all(c['returncode'] == 0 for c in chunks)
+        pdf = midi = None
+        if ok and self.format == "pdf" and _merge_pdf([c['file'] + ".pdf" for c in chunks], self.filename + ".pdf"):
+            pdf = self.filename + ".pdf"
+        mids = [_midi_path(c['file']) for c in chunks]
+        if ok and all(mids):                # durata di ogni sezione in semiminime dalle sue battute
+            quarters = [(c['bars'][1] - c['bars'][0] + 1) * measure * 4 for c in chunks]
+            midi = _midi_merge(mids, self.filename + ".midi", quarters)
+        _toc('merge', t1)
+        return {'chunks': chunks, 'pdf': pdf, 'midi': midi, 'seconds': time.perf_counter() - t0}
+
+    def make_project(self, dirname=None):
+        '''
+        Rendering incrementale: ogni Staff è scritto in un frammento
+        (staff-000.ly, ...) incluso con \\include da un file principale.
+        Un frammento è riscritto solo se il suo hash cambia e lilypond
+        non viene eseguito se nessun file è cambiato (e l'output esiste).
+        Gli hash sono salvati in project.json nella cartella del progetto.
+
+        Args:
+            dirname (str): Cartella del progetto (default filename + "-project")
+
+        Returns:
+            dict: {'dir', 'file': file principale (senza .ly), 'changed': indici dei
+                   frammenti riscritti, 'removed': frammenti eliminati, 'compiled': bool,
+                   'returncode', 'seconds', 'log'}
+
+        Esempio:
+            s = Score((vl, vc), title="Prova")
+            s.make_project("prova")          # compila tutto
+            s = Score((vl, vc2), title="Prova")
+            s.make_project("prova")          # riscrive solo staff-001.ly e ricompila
+        '''
+        t0 = time.perf_counter()
+        dirname = dirname or self.filename + "-project"
+        os.makedirs(dirname, exist_ok=True)
+        manifest = os.path.join(dirname, "project.json")
+        try:
+            with open(manifest) as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            old = {}
+        frags = old.get('fragments', {})
+
+        t1 = _tic()
+        names, hashes, changed = [], {}, []
+        for k, staff in enumerate(self._staves()):
+            name = f"staff-{k:03d}.ly"
+            names.append(name)
+            hashes[name] = hashlib.sha256(staff.encode()).hexdigest()
+            path = os.path.join(dirname, name)
+            if frags.get(name) != hashes[name] or not os.path.exists(path):
+                with open(path, "w") as f:
+                    f.write(staff)
+                changed.append(k)
+        removed = sorted(n for n in frags if n not in hashes)
+        for name in removed:
+            if os.path.exists(os.path.join(dirname, name)):
+                os.remove(os.path.join(dirname, name))
+
+        base = os.path.basename(self.filename)
+        includes = "".join(f"\t\t\\include \"{n}\"\n" for n in names)
+        master = f"\n\\version \"{self.version}\"\n\\language \"english\"\n{self._wrap(includes)}"
+        mhash = hashlib.sha256(f"{self.format}\n{master}".encode()).hexdigest()
+        if old.get('master') != mhash or not os.path.exists(os.path.join(dirname, base + ".ly")):
+            with open(os.path.join(dirname, base + ".ly"), "w") as f:
+                f.write(master)
+            if not changed and not removed:
+                changed = None                          # cambiato solo il file principale
+        _toc('write', t1, fragments=len(changed or ()))
+
+        out = {'dir': dirname, 'file': os.path.join(dirname, base), 'changed': changed or [],
+               'removed': removed, 'compiled': False, 'returncode': old.get('returncode', 0),
+               'seconds': 0.0, 'log': ""}
+        todo = (changed is None or changed or removed or old.get('returncode', 1) != 0
+                or not _has_output(out['file'], self.format))
+        if todo:
+            rc, _, out['log'] = _lilypond(out['file'], self.format, quiet=True)
+            out['compiled'], out['returncode'] = True, rc
+        else:
+            _count('project_skipped')
+        with open(manifest, "w") as f:
+            json.dump({'fragments': hashes, 'master': mhash, 'returncode': out['returncode']}, f, indent=1)
+        out['seconds'] = time.perf_counter() - t0
+        return out
+
 # f = [56,78,89,[86,98,65]]
 # t = [16,16,8,4]
 # i = Staff(f,t).out 
@@ -865,7 +1573,8 @@ def mirror_rhythm(seq, repetition=False):
     else:
         # solo la parte specchiata
         return mirrored
-        def envelope_follower(length, shape='sine', cycles=1, min_val=0, max_val=127, custom_points=None):
+
+def envelope_follower(length, shape='sine', cycles=1, min_val=0, max_val=127, custom_points=None):
     """
     Genera una sequenza di valori in funzione dell'envelope follower (LFO).
 
@@ -896,7 +1605,8 @@ def mirror_rhythm(seq, repetition=False):
         raise ValueError("Shape non riconosciuta.")
     # Mappa ai valori desiderati
     return env * (max_val - min_val) + min_val
-    def mappa_envelope_a_dinamiche(env, dynamic_levels=VELS):
+
+def mappa_envelope_a_dinamiche(env, dynamic_levels=VELS):
     """
     Mappa i valori dell'envelope a dinamiche testuali lilypond.
 
@@ -911,7 +1621,7 @@ def mirror_rhythm(seq, repetition=False):
     idx = np.clip(np.round(env / 127 * (len(dynamic_levels)-1)), 0, len(dynamic_levels)-1).astype(int)
     return [dynamic_levels[i] for i in idx]
 
-    def envelope_follower_smooth(velocities):
+def envelope_follower_smooth(velocities):
     """
     Dati i valori di velocity da envelope_follower,
     restituisce:
@@ -970,41 +1680,1804 @@ def layout_uniforme(staff_str: str,
     """
     
     Inserisce '\break' ogni nbar battute contando le durate estratte
-    direttamente dal testo LilyPond:
-      - Cerca, in ogni token, eventuali cifre (es. '4' in "c'4\\mp")
-      - Le usa come denominatore della semiminima
-      - Calcola battute accumulate e piazza '\break' ogni volta che si raggiunge un multiplo intero di nbar.
+    direttamente dal testo LilyPond (solo il contenuto delle voci, non \\with):
+      - Tempi degli eventi dallo stesso scanner di make_chunks (_voice_scan):
+        gruppi \\tuplet, durate omesse (compact=True) e legature ('4~16')
+        come in lilypond
+      - Piazza '\break' prima di ogni evento che inizia su un multiplo intero
+        di nbar battute (e in fondo alla voce se finisce su un multiplo).
 
     staff_str: stringa generata da Staff(...).out
     nbar:      quante battute vuoi per rigo
     time_num/time_den: firma del tempo (default 4/4)
 
     """
-    tokens = staff_str.split()
-    # token
-    durations = []
-    idxs      = []
-    for i, tok in enumerate(tokens):
-        # caratteri numerici contigui 
-        digits = ''.join(ch for ch in tok if ch.isdigit())
-        if digits:
-            durations.append(float(digits))
-            idxs.append(i)
-
-    #  durate-> battute
-    durs = np.array(durations, dtype=float)
-    beat_lengths = (1.0 / durs) * time_den     # semiminime → battute
-    cum_beats    = np.cumsum(beat_lengths)     # battute totali
-    measures     = cum_beats / time_num        # in misure
-
-    out_tokens = []
-    di = 0  # indice su durations/measures
-    for i, tok in enumerate(tokens):
-        out_tokens.append(tok)
-        if di < len(idxs) and i == idxs[di]:
-            m = measures[di]
-            if abs(m - round(m)) < 1e-6 and int(round(m)) % nbar == 0:
-                out_tokens.append(r"\break")
-            di += 1
-
-    return " ".join(out_tokens)
\ No newline at end of file
+    t0 = _tic()
+    unit = nbar * Fraction(time_num, time_den)
+    out, last = [], 0
+    for a, b in _staff_spans(staff_str):
+        times, poss, _, _, total, _, _ = _voice_scan(staff_str[a:b])
+        cuts = [a + p for t, p in zip(times, poss) if t and t % unit == 0]
+        if total and total % unit == 0:
+            cuts.append(b)
+        for c in cuts:
+            out.append(staff_str[last:c])
+            out.append("\\break ")
+            last = c
+    out.append(staff_str[last:])
+
+    _toc('layout', t0)
+    return "".join(out)
+
+# ============================================================
+# RENDER A SEZIONI (Score.make_chunks)
+# Tokenizer per il sottoinsieme di lilypond generato da pycac:
+# divide le voci sulle stanghette e riporta il contesto (clef/key/time).
+
+LY_TOKEN = re.compile(r"""
+     (?P<tuplet>\\tuplet\s+\d+/\d+)
+    |(?P<time>\\time\s+\d+/\d+)
+    |(?P<key>\\key\s+[a-g]s?\s+\\[a-z]+)
+    |(?P<clef>\\clef\s+"?[A-Za-z_^0-9-]+"?)
+    |(?P<barnum>\\set\s+Score\.currentBarNumber\s*=\s*\#\d+)
+    |(?P<markup>[\^_-]?\\markup\s*\{[^}]*\})
+    |(?P<vsep>\\\\)
+    |(?P<hairpin>\\[<>!])
+    |(?P<cmd>[\^_-]?\\[A-Za-z]+)
+    |(?P<artic>-[>^!._-])
+    |(?P<open2><<)|(?P<close2>>>)
+    |(?P<chord_open><)|(?P<chord_close>>)
+    |(?P<lbrace>\{)|(?P<rbrace>\})
+    |(?P<dur>\d+\.*(?:~\d+\.*)*)
+    |(?P<pitch>[a-g]s?[,']*(?![A-Za-z]))
+    |(?P<rest>[rs](?![A-Za-z]))
+    |(?P<tie>~)
+    |(?P<other>\S)
+""", re.X)
+
+_LY_VALUES = {}
+
+def _ly_value(sym):
+    '''Simbolo di durata lilypond ('4.', '2~8.') --> frazione dell'intero'''
+    v = _LY_VALUES.get(sym)
+    if v is None:
+        v = Fraction(0)
+        for part in sym.split('~'):
+            base = part.rstrip('.')
+            dots = len(part) - len(base)
+            v += Fraction(1, int(base)) * (2 - Fraction(1, 2**dots))
+        _LY_VALUES[sym] = v
+    return v
+
+def _voice_scan(music):
+    '''
+    Scansione di una voce (contenuto tra graffe).
+    OUT: (tempi, posizioni, contesti, correzioni, durata totale, contesto finale, altezze)
+         per ogni evento fuori dai gruppi irregolari:
+         • tempo di inizio e posizione nel testo
+         • contesto (dict con gli ultimi clef/key/time)
+         • correzione = ((pos, dinamica), (pos, durata)) con None se l'evento
+                        ha già una dinamica / una durata propria
+                        (per un \\tuplet: quelle della sua prima nota)
+         altezze = (posizioni delle durate senza altezza, altezza che ripetono,
+                    posizioni degli eventi con altezza), anche dentro i gruppi
+    '''
+    times, poss, ctxs, fixes = [], [], [], []
+    bare, bare_pitch, pitched = [], [], []
+    pitch = None                             # ultima altezza / accordo (ripetuta da "4")
+    ctx = {}
+    t = Fraction(0)
+    last, last_sym = Fraction(1, 4), '4'     # durata di default di lilypond
+    dyn = None                               # ultima dinamica
+    factor = one = Fraction(1)               # fattore dei gruppi irregolari
+    scales, pending = [], None
+    ev = None        # [fattore, durata, indice, fine altezza, fine durata, dinamica precedente, con dinamica,
+                     #  inizio, tipo]
+    in_chord = False
+    group = None     # indice di un \tuplet: la correzione va sulla sua prima nota
+    for m in LY_TOKEN.finditer(music):
+        kind = m.lastgroup
+        start = False
+        if kind in ('pitch', 'rest'):
+            start = not in_chord
+        elif kind == 'chord_open':
+            start, in_chord = True, True
+        elif kind == 'chord_close':
+            in_chord = False
+        elif kind == 'dur':
+            if ev is None or ev[1] is not None:   # durata senza altezza
+                start = True
+        elif kind == 'tuplet':
+            pending = 1 / Fraction(*map(int, m.group().split()[-1].split('/')))
+        elif kind == 'lbrace':
+            scales.append(factor)
+            factor = factor * (pending or 1)
+            pending = None
+        elif kind == 'rbrace':
+            if scales:
+                factor = scales.pop()
+        elif kind in ('clef', 'key', 'time'):
+            ctx = dict(ctx)
+            ctx[kind] = m.group()
+        elif kind == 'cmd' and m.group() in VELS:
+            dyn = m.group()
+            if ev is not None:
+                ev[6] = True
+
+        if start or kind == 'tuplet':
+            if ev is not None:
+                t += (ev[1] or last) if ev[0] is one else (ev[1] or last) * ev[0]
+                if ev[2] is not None:
+                    fixes[ev[2]] = ((ev[4] or ev[3], None if ev[6] else ev[5]),
+                                    (ev[3], None if ev[1] else last_sym))
+                if ev[1]:               # '4~16' --> la durata seguente è 16
+                    last_sym = music[ev[3]:ev[4]].strip().rsplit('~', 1)[-1]
+                    last = _ly_value(last_sym)
+                if ev[8] in ('pitch', 'chord_open'):
+                    pitch = music[ev[7]:ev[3]]
+            ev = [factor, None, None, m.start(), None, dyn, False, m.start(), kind] if start else None
+            if kind == 'dur' and start:
+                bare.append(m.start())
+                bare_pitch.append(pitch)
+            elif kind in ('pitch', 'chord_open') and start:
+                pitched.append(m.start())
+            if not scales:
+                if ev is not None:
+                    ev[2] = len(fixes)
+                group = len(fixes) if kind == 'tuplet' else None
+                times.append(t)
+                poss.append(m.start())
+                ctxs.append(ctx)
+                fixes.append(None)
+            elif ev is not None and group is not None:
+                ev[2], group = group, None
+        if kind == 'dur':
+            ev[1], ev[4] = _ly_value(m.group()), m.end()
+        elif kind in ('pitch', 'rest') and not in_chord or kind == 'chord_close':
+            ev[3] = m.end()
+    if ev is not None:
+        t += (ev[1] or last) * ev[0]
+        if ev[2] is not None:
+            fixes[ev[2]] = ((ev[4] or ev[3], None if ev[6] else ev[5]),
+                            (ev[3], None if ev[1] else last_sym))
+    return times, poss, ctxs, fixes, t, ctx, (bare, bare_pitch, pitched)
+
+def _staff_spans(text):
+    '''Posizioni (inizio, fine) del contenuto di ogni voce { } di uno Staff'''
+    spans, depth, skip, start = [], 0, False, 0
+    for m in re.finditer(r'\\with\s*\{|\{|\}', text):
+        if m.group() == '}':
+            depth -= 1
+            if depth == 0:
+                if not skip:
+                    spans.append((start, m.start()))
+                skip = False
+        else:
+            if depth == 0:
+                skip  = m.group() != '{'
+                start = m.end()
+            depth += 1
+    return spans
+
+def _split_staff(text, time_num=4, time_den=4):
+    '''Analizza uno Staff (stringa), OUT: (numero di battute, info per _chunk_staff)'''
+    measure = Fraction(time_num, time_den)
+    spans  = _staff_spans(text)
+    voices = [_voice_scan(text[a:b]) for a, b in spans]
+    total  = max([v[4] for v in voices] + [Fraction(0)])
+    nbars  = -(-total // measure)                      # ceil
+    return int(nbars), {'text': text, 'spans': spans, 'voices': voices, 'measure': measure}
+
+def _cut_ok(staves, bar):
+    '''True se in ogni voce di ogni Staff un evento inizia sulla battuta bar (o la voce è finita)'''
+    for _, info in staves:
+        t = bar * info['measure']
+        for times, _, _, _, total, _, _ in info['voices']:
+            i = bisect.bisect_left(times, t)
+            if t < total and (i == len(times) or times[i] != t):
+                return False
+    return True
+
+def _chunk_staff(staff, bar, end):
+    '''Stringa dello Staff ridotta alle battute [bar, end) con il contesto iniziale'''
+    nbars, info = staff
+    text, m = info['text'], info['measure']
+    out, last = [], 0
+    for (a, b), (times, poss, ctxs, fixes, total, final, pitches) in zip(info['spans'], info['voices']):
+        i = bisect.bisect_left(times, bar * m)
+        j = bisect.bisect_left(times, end * m)
+        start = a if bar == 0 else (a + poss[i] if i < len(poss) else b)
+        stop  = a + poss[j] if j < len(poss) else b
+        music, prefix = text[start:stop], ""
+        if bar > 0:
+            ctx = ctxs[i] if i < len(ctxs) else final
+            ins = []
+            if i < len(fixes) and fixes[i] is not None:
+                # durata implicita e dinamica corrente scritte sul primo evento
+                ins += [(pos, sym) for pos, sym in fixes[i] if sym is not None and a + pos <= stop]
+            bare, bare_pitch, pitched = pitches
+            k = bisect.bisect_left(bare, start - a)
+            if k < len(bare) and a + bare[k] < stop and bare_pitch[k] is not None:
+                p = bisect.bisect_left(pitched, start - a)
+                if p == len(pitched) or pitched[p] > bare[k]:
+                    ins.append((bare[k], bare_pitch[k]))    # "4" senza altezza precedente
+            for pos, sym in sorted(ins, key=lambda x: x[0], reverse=True):
+                cut = a + pos - start
+                music = music[:cut] + sym + music[cut:]
+            prefix = " ".join([f"\\set Score.currentBarNumber = #{bar+1}"] + list(ctx.values())) + " "
+        out.append(text[last:a])
+        out.append(" " + prefix + music + " ")
+        last = b
+    out.append(text[last:])
+    return "".join(out)
+
+def _merge_pdf(files, out):
+    '''Unisce i pdf con pypdf (se installato) o ghostscript. OUT: True se riuscito'''
+    try:
+        from pypdf import PdfWriter
+    except ImportError:
+        gs = shutil.which("gs")
+        if gs is None:
+            return False
+        cmd = [gs, "-q", "-dNOPAUSE", "-dBATCH", "-sDEVICE=pdfwrite", f"-sOutputFile={out}", *files]
+        return subprocess.run(cmd).returncode == 0
+    w = PdfWriter()
+    for f in files:
+        w.append(f)
+    w.write(out)
+    w.close()
+    return True
+
+def _midi_path(filename):
+    '''File midi generato da lilypond (.midi o .mid) oppure None'''
+    for ext in (".midi", ".mid"):
+        if os.path.exists(filename + ext):
+            return filename + ext
+    return None
+
+def _vlq_read(data, i):
+    n = 0
+    while True:
+        b = data[i]
+        i += 1
+        n = (n << 7) | (b & 0x7F)
+        if not b & 0x80:
+            return n, i
+
+def _vlq_write(n):
+    out = [n & 0x7F]
+    n >>= 7
+    while n:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    return bytes(reversed(out))
+
+def _midi_track(trk):
+    '''Traccia midi --> (lista di (tick assoluto, evento con status esplicito), tick finale)'''
+    events, t, i, status = [], 0, 0, 0
+    while i < len(trk):
+        delta, i = _vlq_read(trk, i)
+        t += delta
+        b = trk[i]
+        if b == 0xFF:                                 # meta evento
+            ln, j = _vlq_read(trk, i + 2)
+            if trk[i+1] == 0x2F:                      # fine traccia
+                break
+            events.append((t, trk[i:j+ln]))
+            i = j + ln
+        elif b in (0xF0, 0xF7):                       # sysex
+            ln, j = _vlq_read(trk, i + 1)
+            events.append((t, trk[i:j+ln]))
+            i = j + ln
+        else:
+            if b & 0x80:                              # altrimenti running status
+                status = b
+                i += 1
+            n = 1 if status & 0xF0 in (0xC0, 0xD0) else 2
+            events.append((t, bytes([status]) + trk[i:i+n]))
+            i += n
+    return events, t
+
+def _midi_read(path):
+    '''File midi --> (division, lista di tracce di _midi_track)'''
+    with open(path, "rb") as f:
+        data = f.read()
+    division = struct.unpack(">H", data[12:14])[0]
+    pos, tracks = 8 + struct.unpack(">I", data[4:8])[0], []
+    while pos + 8 <= len(data):
+        ln = struct.unpack(">I", data[pos+4:pos+8])[0]
+        if data[pos:pos+4] == b"MTrk":
+            tracks.append(_midi_track(data[pos+8:pos+8+ln]))
+        pos += 8 + ln
+    return division, tracks
+
+def _midi_merge(files, out, quarters=None):
+    '''
+    Concatena nel tempo file midi (formato 1, stessa division). OUT: out
+    quarters: durata di ogni file in semiminime (pause finali comprese);
+              se None vale la fine dell'ultima traccia
+    '''
+    parts = [_midi_read(f) for f in files]
+    division = parts[0][0]
+    ntracks = max(len(p[1]) for p in parts)
+    merged = [[] for _ in range(ntracks)]
+    offset = 0
+    for k, (_, tracks) in enumerate(parts):
+        for n, (events, end) in enumerate(tracks):
+            merged[n].extend((t + offset, e) for t, e in events)
+        if quarters is None:
+            offset += max([end for _, end in tracks] + [0])
+        else:
+            offset += int(round(quarters[k] * division))
+    with open(out, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 1, ntracks, division))
+        for events in merged:
+            body, prev = bytearray(), 0
+            for t, e in events:
+                body += _vlq_write(t - prev) + e
+                prev = t
+            body += _vlq_write(max(0, offset - prev)) + b"\xff\x2f\x00"
+            f.write(b"MTrk" + struct.pack(">I", len(body)) + bytes(body))
+    return out
+
+
+# ============================================================
+# ARCHIVI COLONNARI DEL MATERIALE (save_material / load_material)
+# Il materiale (note/dur/vel/exp + opzioni di Staff) è salvato in array numpy
+# piatti con offset:
+#   staff_off  [staff+1]  --> voci di ogni staff
+#   note_off   [voci+1]   --> eventi di altezza di ogni voce
+#   pitch_off  [eventi+1] --> altezze di ogni evento (accordo se chord = 1)
+#   dur_off    [voci+1]   --> durate di ogni voce, dur_val (int, -1-k = simbolo k di dur_vocab
+#                             come '8.' o '4~16'), sub_off/dur_sub (irregolari)
+#   vel_off    [voci+1]   --> vel_val
+#   exp_off    [voci+1]   --> exp_code (indice in exp_vocab, -1 = 00, -1-m = maschera m)
+#   mode       [voci, 4]  --> -1 = None, 0 = senza modo, 1 = 'zero', 2 = 'mod'
+# Formato .npz oppure cartella di .npy (memory-mapped) + meta.json
+
+MODES = (None, 'zero', 'mod')
+PARAMS = ('note', 'dur', 'vel', 'exp')
+
+def _staff_material(obj):
+    '''_Voice / Staff / Score / lista di dict --> lista di dict (argomenti di Staff)'''
+    if isinstance(obj, (_Voice, Staff)):
+        return [obj.material]
+    if isinstance(obj, Score):
+        if obj.material is None:
+            raise ValueError("Score senza materiale: usa Score.from_specs o una lista di Staff")
+        return list(obj.material)
+    return [o.material if isinstance(o, (_Voice, Staff)) else o for o in obj]
+
+def _split_mode(a):
+    '''Parametro --> (lista senza modo, codice del modo)'''
+    if a is None:
+        return [], -1
+    if isinstance(a, np.ndarray):
+        a = a.tolist()
+    a = _chord_list(a)
+    if type(a) is not list:
+        return [a], 0
+    if a and type(a[-1]) is str and a[-1] in ('zero', 'mod'):
+        return a[:-1], MODES.index(a[-1])
+    return a, 0
+
+def save_material(path, obj, compressed=False):
+    '''
+    Salva il materiale generato in forma colonnare.
+
+    Args:
+        path (str): File .npz oppure cartella (un .npy per colonna, caricabile in mmap)
+        obj: _Voice, Staff, Score (creata con from_specs) o lista di Staff / dict di argomenti
+        compressed (bool): .npz compresso (non memory-mappable)
+
+    Returns:
+        str: path
+    '''
+    cols = {k: [] for k in ('pitch', 'pitch_off', 'chord', 'note_off', 'dur_val', 'dur_sub', 'sub_off',
+                            'dur_off', 'vel_val', 'vel_off', 'exp_code', 'exp_off', 'staff_off', 'mode')}
+    for k in ('pitch_off', 'note_off', 'sub_off', 'dur_off', 'vel_off', 'exp_off', 'staff_off'):
+        cols[k].append(0)
+    vocab, dvocab, options = {}, {}, []
+    dcode = lambda d: -1 - dvocab.setdefault(d, len(dvocab)) if type(d) is str else d
+    for staff in _staff_material(obj):
+        staff = dict(staff)
+        voices = staff.pop('note', None)
+        multi  = type(voices) == tuple
+        nvoice = len(voices) if multi else 1
+        params = {k: staff.pop(k, None) for k in PARAMS[1:]}
+        params['note'] = voices
+        for v in range(nvoice):
+            modes = []
+            for k in PARAMS:
+                val = params[k]
+                if multi:
+                    val = None if val is None else val[v]
+                val, mode = _split_mode(val)
+                modes.append(mode)
+                if k == 'note':
+                    for p in val:
+                        chord = type(p) is list
+                        cols['pitch'].extend(p if chord else [p])
+                        cols['chord'].append(chord)
+                        cols['pitch_off'].append(len(cols['pitch']))
+                elif k == 'dur':
+                    for d in val:
+                        if type(d) is list:                     # irregolare [base, [sudd]]
+                            cols['dur_val'].append(dcode(d[0]))
+                            cols['dur_sub'].extend(d[1])
+                        else:
+                            cols['dur_val'].append(dcode(d))
+                        cols['sub_off'].append(len(cols['dur_sub']))
+                elif k == 'vel':
+                    cols['vel_val'].extend(val)
+                else:
+                    cols['exp_code'].extend(vocab.setdefault(e, len(vocab)) if type(e) is str
+                                            else -1 - exp_mask(e) for e in val)
+            cols['note_off'].append(len(cols['pitch_off']) - 1)
+            cols['dur_off'].append(len(cols['dur_val']))
+            cols['vel_off'].append(len(cols['vel_val']))
+            cols['exp_off'].append(len(cols['exp_code']))
+            cols['mode'].append(modes)
+        cols['staff_off'].append(len(cols['mode']))
+        staff['multi'] = multi
+        options.append(staff)
+
+    vel = np.asarray(cols.pop('vel_val'), dtype=float)
+    arrays = {k: np.asarray(v, dtype=np.int64) for k, v in cols.items()}
+    arrays['chord'] = arrays['chord'].astype(np.bool_)
+    arrays['mode']  = arrays['mode'].reshape(-1, 4).astype(np.int8)
+    arrays['vel_val'] = vel.astype(np.int64) if np.all(vel == np.round(vel)) else vel
+    arrays['exp_vocab'] = np.array(list(vocab) or [''], dtype=str)
+    arrays['dur_vocab'] = np.array(list(dvocab) or [''], dtype=str)
+    meta = {'version': 1, 'staves': options}
+
+    if path.endswith(".npz"):
+        (np.savez_compressed if compressed else np.savez)(path, meta=np.array(json.dumps(meta)), **arrays)
+    else:
+        os.makedirs(path, exist_ok=True)
+        for k, v in arrays.items():
+            np.save(os.path.join(path, k + ".npy"), v)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+    return path
+
+class Material:
+    '''
+    Archivio di materiale salvato con save_material.
+    Le colonne sono lette solo quando servono (memory-mapped se cartella):
+    leggere uno staff tocca solo le sue porzioni degli array.
+        len(m)          --> numero di staff
+        m[i] / m[a:b]   --> dict (lista di dict) di argomenti di Staff
+        .voice(i)       --> dict note/dur/vel/exp della voce i (globale)
+        .staff(i, **kw) --> Staff
+        .score(staves=slice(None), workers=None, **kw) --> Score
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._cols = {}
+        if path.endswith(".npz"):
+            self._npz = np.load(path)
+            meta = str(self._npz['meta'])
+        else:
+            self._npz = None
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = f.read()
+        self.meta = json.loads(meta)
+
+    def _col(self, name):
+        c = self._cols.get(name)
+        if c is None:
+            if self._npz is not None:
+                c = self._npz[name]
+            else:
+                c = np.load(os.path.join(self.path, name + ".npy"), mmap_mode='r')
+            self._cols[name] = c
+        return c
+
+    def __len__(self):
+        return len(self.meta['staves'])
+
+    def voice(self, i):
+        '''Argomenti note/dur/vel/exp della voce i (indice globale)'''
+        out = {}
+        mode = self._col('mode')[i]
+
+        a, b = self._col('note_off')[i:i+2]
+        offs = self._col('pitch_off')[a:b+1]
+        pitch = self._col('pitch')[offs[0]:offs[-1]].tolist()
+        chord = self._col('chord')[a:b].tolist()
+        rel = (offs - offs[0]).tolist()
+        out['note'] = [pitch[rel[k]:rel[k+1]] if chord[k] else pitch[rel[k]] for k in range(b - a)]
+
+        a, b = self._col('dur_off')[i:i+2]
+        vals = self._col('dur_val')[a:b].tolist()
+        if vals and min(vals) < 0:                          # simboli ('8.', '4~16')
+            dvocab = self._col('dur_vocab').tolist()
+            vals = [dvocab[-1 - d] if d < 0 else d for d in vals]
+        offs = self._col('sub_off')[a:b+1]
+        subs = self._col('dur_sub')[offs[0]:offs[-1]].tolist()
+        rel = (offs - offs[0]).tolist()
+        out['dur'] = [[vals[k], subs[rel[k]:rel[k+1]]] if rel[k+1] > rel[k] else vals[k] for k in range(b - a)]
+
+        a, b = self._col('vel_off')[i:i+2]
+        out['vel'] = self._col('vel_val')[a:b].tolist()
+
+        a, b = self._col('exp_off')[i:i+2]
+        vocab = self._col('exp_vocab').tolist()
+        out['exp'] = [vocab[c] if c >= 0 else -1 - c for c in self._col('exp_code')[a:b].tolist()]
+
+        for k, m in zip(PARAMS, mode.tolist()):
+            if m == -1:
+                out[k] = None
+            elif m > 0:
+                out[k].append(MODES[m])
+        return out
+
+    def __getitem__(self, i):
+        if type(i) == slice:
+            return [self[n] for n in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        opts = dict(self.meta['staves'][i])
+        multi = opts.pop('multi')
+        a, b = self._col('staff_off')[i:i+2].tolist()
+        voices = [self.voice(v) for v in range(a, b)]
+        if multi:
+            for k in PARAMS:
+                vals = tuple(v[k] for v in voices)
+                opts[k] = None if k != 'note' and all(x is None for x in vals) else vals
+        else:
+            opts.update(voices[0])
+        return opts
+
+    def staff(self, i, **kwargs):
+        return Staff(**self[i], **kwargs)
+
+    def score(self, staves=slice(None), workers=None, **kwargs):
+        '''Ricrea una Score (solo gli staff selezionati) con Score.from_specs'''
+        return Score.from_specs(self[staves], workers=workers, **kwargs)
+
+def load_material(path):
+    '''Apre un archivio salvato con save_material. OUT: Material'''
+    return Material(path)
+
+# ============================================================
+# PLAYBACK IN TEMPO REALE (Player)
+# Gli stessi ingressi di _Voice/Staff (accordi, pause, irregolari, 00 = precedente)
+# diventano messaggi midi (status, nota, velocity) con un istante in secondi.
+# Ogni staff usa un canale midi (staff % 16).
+
+def _voice_events(v, channel, whole):
+    '''Voce (dict note/dur/vel/exp) --> lista di (secondi, ordine, messaggio)'''
+    args = []
+    for k in PARAMS:
+        a = v.get(k)
+        if isinstance(a, np.ndarray):
+            a = a.tolist()
+        a = _chord_list(a)
+        args.append(list(a) if type(a) == list else a)     # dflt() modifica la lista
+    note, dur, vel, exp = ([a[0:-1], a[-1]] for a in map(dflt, args))
+    n = getdurmax(note[0], dur[0], vel[0], exp[0])
+    note, dur, vel = selmode(note, n), selmode(dur, n), selmode(vel, n)
+
+    durs = []                                  # (durata, durata scritta) in interi, None = precedente
+    for d in dur:
+        if type(d) == list:                    # irregolare o puntato
+            sym = mapDur([d])
+            sym = sym[0][1] if sym and type(sym[0]) == list else sym     # irregolare o ['8.', '4~16']
+            for i, s in enumerate(d[1]):
+                real = s / (d[0] * sum(d[1]))
+                written = float(_ly_value(sym[i].rsplit('~', 1)[-1])) if i < len(sym) and sym[i] else real
+                durs.append((real, written))
+        elif type(d) is str and d:             # simbolo lilypond ('8.', '4~16')
+            durs.append((float(_ly_value(d)), float(_ly_value(d.rsplit('~', 1)[-1]))))
+        else:
+            durs.append((1 / d, 1 / d) if d not in ('', 00) else None)
+
+    out, t = [], 0.0
+    last, d, w, v = [], 0.25, 0.25, 64         # altezze precedenti, durata, durata scritta, velocity
+    for k in range(n):
+        p = note[k] if k < len(note) else ''
+        if k < len(durs) and durs[k] is not None:
+            d, w = durs[k]
+        else:                                  # senza durata: l'ultima scritta (come lilypond)
+            d = w
+        if k < len(vel) and vel[k] not in ('', 00):
+            v = int(min(max(vel[k], 1), 127))
+        if type(p) == list:                    # accordo
+            pitches = last = [int(x) for x in p if x >= 0]
+        elif p in (-1, -2):                    # pausa o spazio
+            pitches = []
+        elif p in ('', 00):                    # altezza precedente
+            pitches = last
+        else:
+            pitches = last = [int(p)]
+        for x in pitches:
+            out.append((t * whole, 1, (0x90 | channel, x, v)))
+            out.append(((t + d) * whole, 0, (0x80 | channel, x, 0)))
+        t += d
+    return out
+
+def midi_events(obj, tempo=60):
+    '''
+    Converte il materiale in eventi midi temporizzati.
+
+    Args:
+        obj: _Voice, Staff, Score (from_specs), Material o lista di dict (argomenti di Staff)
+        tempo (float): Semiminime al minuto
+
+    Returns:
+        list: [(secondi, (status, nota, velocity))] ordinata, note-off prima dei note-on simultanei
+    '''
+    whole = 240 / tempo                       # durata dell'intero in secondi
+    staves = obj[:] if isinstance(obj, Material) else _staff_material(obj)
+    out = []
+    for ch, staff in enumerate(staves):
+        note = staff.get('note')
+        if type(note) == tuple:
+            for i in range(len(note)):
+                out += _voice_events({k: None if staff.get(k) is None else staff[k][i] for k in PARAMS},
+                                     ch % 16, whole)
+        else:
+            out += _voice_events(staff, ch % 16, whole)
+    out.sort(key=lambda e: (e[0], e[1]))
+    return [(e[0], e[2]) for e in out]
+
+class VirtualPort:
+    '''
+    Porta midi locale (sostituto di una porta reale): registra i messaggi.
+    Qualsiasi oggetto con .send(msg) può essere usato come sink.
+        .messages --> [(istante di ricezione, istante previsto, messaggio)]
+    '''
+    def __init__(self):
+        self.messages = []
+        self.due = None
+
+    def send(self, msg):
+        self.messages.append((time.monotonic(), self.due, msg))
+
+class Player:
+    '''
+    Riproduce il materiale in tempo reale su un clock asyncio.
+    Gli eventi sono inviati ai sink con lookahead secondi di anticipo
+    insieme all'istante previsto (tempo di loop.time()).
+    IN: • materiale (come midi_events)
+        • tempo (semiminime al minuto)
+        • sinks: callable fn(istante, msg) | asyncio.Queue (riceve (istante, msg)) | oggetto con .send(msg)
+        • lookahead (secondi di anticipo, 0 = invio all'istante esatto)
+        • interval (risveglio massimo dello scheduler in secondi)
+    OUT: await .play() --> metriche {'events', 'mean', 'max', 'p99', 'late', 'duration'}
+         latenza = ritardo dell'invio rispetto a (istante - lookahead), in secondi
+         late = eventi inviati dopo il loro istante previsto
+         .stop() interrompe e spegne le note attive
+    '''
+    def __init__(self, material, tempo=60, sinks=(), lookahead=0.05, interval=0.01):
+        self.events    = midi_events(material, tempo)
+        self.sinks     = list(sinks)
+        self.lookahead = lookahead
+        self.interval  = interval
+        self.metrics   = None
+        self._stop     = False
+
+    def _send(self, due, msg):
+        for s in self.sinks:
+            if isinstance(s, asyncio.Queue):
+                s.put_nowait((due, msg))
+            elif hasattr(s, "send"):
+                if isinstance(s, VirtualPort):
+                    s.due = due
+                s.send(msg)
+            else:
+                s(due, msg)
+
+    def stop(self):
+        self._stop = True
+
+    async def play(self):
+        loop = asyncio.get_running_loop()
+        start = loop.time() + self.lookahead          # preroll
+        lat, active = [], set()
+        i, n = 0, len(self.events)
+        self._stop = False
+        while i < n and not self._stop:
+            now = loop.time()
+            horizon = now + self.lookahead
+            while i < n and start + self.events[i][0] <= horizon:
+                due = start + self.events[i][0]
+                msg = self.events[i][1]
+                self._send(due, msg)
+                lat.append(now - (due - self.lookahead))
+                if msg[0] & 0xF0 == 0x90:
+                    active.add((msg[0] & 0x0F, msg[1]))
+                else:
+                    active.discard((msg[0] & 0x0F, msg[1]))
+                i += 1
+            if i < n:
+                wait = start + self.events[i][0] - self.lookahead - loop.time()
+                await asyncio.sleep(min(max(wait, 0), self.interval))
+        for ch, p in sorted(active):                  # interrotto: note-off
+            self._send(loop.time(), (0x80 | ch, p, 0))
+
+        lat = np.array(lat or [0.0])
+        self.metrics = {'events': i, 'mean': float(lat.mean()), 'max': float(lat.max()),
+                        'p99': float(np.percentile(lat, 99)),
+                        'late': int(np.sum(lat > self.lookahead)) if i else 0,
+                        'duration': loop.time() - start + self.lookahead}
+        return self.metrics
+
+# ============================================================
+# PARSER DEL LILYPOND GENERATO DA PYCAC (parse_ly)
+# Ricostruisce gli ingressi di Staff (note/dur/vel/exp) da Staff.out / Score.out
+# con una sola scansione di LY_TOKEN per voce.
+#   • altezze PCHS --> midinote, r = -1, s = -2, nota senza altezza = 00
+#   • durate 1..32 --> int, altri simboli ('8.', '4~16') --> stringa, senza durata = 00
+#   • \\tuplet --> [base, [suddivisioni]]
+#   • VELS --> velocity centrale della fascia di mapVel, EXPR --> chiave (tuple se più simboli)
+
+PITCH_MIDI = {p.strip(): i for i, p in enumerate(PCHS)}
+VEL_MIDI   = {v: 5 + 10 * i for i, v in enumerate(VELS)}
+EXPR_KEYS  = {}
+for _k, _v in EXPR.items():
+    if _v:
+        EXPR_KEYS.setdefault(_v, _k)
+TUPLET_SUMS = {'3/2': (3,), '5/4': (5, 10), '6/4': (6, 12), '7/4': (7, 14), '9/8': (9,),
+               '11/8': (11, 22), '13/8': (13, 26), '15/8': (15, 30)}
+REGULAR = {str(d): d for d in (1, 2, 4, 8, 16, 32)}
+
+def _tuplet_dur(ratio, syms):
+    '''\\tuplet n/d + simboli --> [base, [suddivisioni]] come in mapDur'''
+    n, d = map(int, ratio.split('/'))
+    vals = [_ly_value(x) * Fraction(d, n) for x in syms]
+    total = sum(vals)
+    if total.numerator != 1:
+        raise ValueError(f"gruppo irregolare non rappresentabile: \\tuplet {ratio} {syms}")
+    rel = [v / total for v in vals]
+    den = 1
+    for r in rel:
+        den = den * r.denominator // np.gcd(den, r.denominator)
+    for tot in TUPLET_SUMS.get(ratio, ()):
+        if tot % den == 0:
+            return [total.denominator, [int(r * tot) for r in rel]]
+    raise ValueError(f"gruppo irregolare non rappresentabile: \\tuplet {ratio} {syms}")
+
+def _parse_voice(music):
+    '''
+    Contenuto di una voce --> dict note/dur/vel/exp
+    Ogni evento di pycac è scritto senza spazi (altezza + durata + dinamica + espressione)
+    tranne lo spazio finale dei PCHS senza ottava e delle pause ('c ', 'r '):
+    durate e simboli attaccati all'evento precedente gli appartengono,
+    altrimenti aprono un nuovo evento senza altezza (00).
+    Gli eventi sono separati da uno spazio: ogni spazio in più è un evento vuoto.
+    '''
+    note, syms, vel, exp = [], [], [], []
+    groups = []                 # gruppi irregolari (ratio, primo evento, ultimo evento)
+    chord, ratio, group = None, None, None
+    wait = -1                   # posizione in cui una durata appartiene all'ultimo evento
+    tail = 0                    # posizione in cui un simbolo appartiene all'ultimo evento
+
+    def empty(end):             # eventi vuoti (solo lo spazio) fino a end
+        if tail >= 0 and music[tail:end].strip(' ') == '':
+            for _ in range(end - tail - 1):
+                note.append(00)
+                syms.append(None)
+                vel.append(00)
+                exp.append([])
+
+    for m in LY_TOKEN.finditer(music):
+        kind, g = m.lastgroup, m.group()
+        if chord is None and m.start() != tail:
+            empty(m.start())
+        if kind == 'pitch' or kind == 'rest':
+            val = PITCH_MIDI[g] if kind == 'pitch' else (-1 if g == 'r' else -2)
+            if chord is not None:
+                chord.append(val)
+                continue
+        elif kind == 'chord_open':
+            chord = []
+            continue
+        elif kind == 'chord_close':
+            val, chord = chord, None
+        elif kind == 'dur':
+            if m.start() == wait:                       # durata attaccata all'altezza
+                syms[-1], wait, tail = g, -1, m.end()
+                continue
+            val = 00                                    # durata senza altezza
+        elif g in VEL_MIDI or g in EXPR_KEYS:
+            if m.start() != tail:                       # simbolo senza altezza né durata
+                note.append(00)
+                syms.append(None)
+                vel.append(00)
+                exp.append([])
+            if g in VEL_MIDI:
+                vel[-1] = VEL_MIDI[g]
+            else:
+                exp[-1].append(EXPR_KEYS[g])
+            wait, tail = -1, m.end()
+            continue
+        else:
+            wait, tail = -1, -1
+            if kind == 'tuplet':
+                ratio, tail = g.split()[-1], m.end()
+            elif kind == 'lbrace' and ratio is not None:
+                group, ratio, tail = [ratio, len(note)], None, m.end()
+            elif kind == 'rbrace' and group is not None:
+                groups.append((group[0], group[1], len(note)))
+                group, tail = None, m.end()
+            continue
+        note.append(val)                                # nuovo evento
+        syms.append(g if kind == 'dur' else None)
+        vel.append(00)
+        exp.append([])
+        wait = -1
+        tail = m.end()
+        if kind != 'dur':                               # PCHS senza ottava e pause: 'c ', 'r '
+            wait = tail = m.end() + (kind != 'chord_close' and g.isalpha())
+    empty(len(music) - 1)                               # '{ ' + eventi + ' }'
+
+    dur, k, last, compact = [], 0, '4', False
+    for ratio, a, b in groups + [(None, len(note), len(note))]:
+        for s in syms[k:a]:                             # durate regolari
+            dur.append(00 if s is None else REGULAR.get(s, s))
+            last = last if s is None else s.rsplit('~', 1)[-1]
+        if ratio is not None:                           # durate omesse (compact) = precedente
+            group = []
+            for s in syms[a:b]:
+                last = last if s is None else s.rsplit('~', 1)[-1]
+                group.append(last if s is None else s)
+                compact = compact or s is None
+            dur.append(_tuplet_dur(ratio, group))
+        k = b
+    exp = [00 if not e else e[0] if len(e) == 1 else tuple(e) for e in exp]
+    out = {'note': note, 'dur': dur, 'vel': vel, 'exp': exp}
+    if compact:                                         # \tuplet con durate omesse
+        out['compact'] = True
+    return out
+
+HEADER_FIELD = re.compile(r'(instrumentName|shortInstrumentName|midiInstrument|title|composer)\s*=\s*"([^"]*)"|\\clef\s+"?([^\s"}]+)"?')
+STAFF_KEYS_LY = {'instrumentName': 'i_name', 'shortInstrumentName': 'i_short', 'midiInstrument': 'i_midi'}
+
+def _parse_staff(text):
+    '''Testo di uno Staff (da \\new Staff alla fine delle sue voci) --> argomenti di Staff'''
+    out = {}
+    spans = _staff_spans(text)
+    w = re.search(r'\\with\s*\{([^}]*)\}', text)
+    if w is not None:
+        for m in HEADER_FIELD.finditer(w.group(1)):
+            if m.group(3):
+                out['clef'] = m.group(3)
+            elif m.group(1) in STAFF_KEYS_LY:
+                out[STAFF_KEYS_LY[m.group(1)]] = m.group(2)
+        if out.get('i_midi') == "acoustic grand":      # default di Staff
+            del out['i_midi']
+    voices = [_parse_voice(text[a:b]) for a, b in spans]
+    if len(voices) == 1:
+        out.update(voices[0])
+    elif voices:
+        for k in PARAMS:
+            out[k] = tuple(v[k] for v in voices)
+        if any('compact' in v for v in voices):
+            out['compact'] = True
+    return out
+
+def _staff_ends(text, starts):
+    '''Fine di ogni staff: chiusura di { } oppure di << >> dopo il blocco \\with'''
+    ends = []
+    for s in starts:
+        depth, angle, seen = 0, 0, False
+        for m in re.finditer(r'\\with\s*\{|<<|>>|\{|\}', text[s:]):
+            g = m.group()
+            if g == '}':
+                depth -= 1
+            elif g == '<<':
+                angle += 1
+            elif g == '>>':
+                angle -= 1
+                if angle < 0:                  # chiusura dello StaffGroup: staff vuoto
+                    break
+            else:
+                depth += 1
+                seen = seen or g == '{'
+            if seen and depth == 0 and angle == 0:
+                break
+        ends.append(s + m.end() if m is not None else len(text))
+    return ends
+
+def parse_ly(text):
+    '''
+    Ricostruisce il materiale da codice lilypond generato da pycac
+    (_Voice.out, Staff.out, Score.out o un file .ly di make_file).
+
+    Args:
+        text (str): Codice lilypond
+
+    Returns:
+        dict: {'title', 'composer', 'staves': [dict di argomenti di Staff]}
+              Staff(**staff).out riproduce il rigo originale. Le durate omesse
+              da compact=True nei gruppi irregolari vengono ricostruite per esteso:
+              in quel caso il dict contiene anche 'compact': True.
+
+    Esempio:
+        parsed = read_ly("score.ly")
+        Score.from_specs(parsed['staves'], title=parsed['title']).make_file
+    '''
+    out = {'title': None, 'composer': None, 'staves': []}
+    h = re.search(r'\\header\s*\{([^}]*)\}', text)
+    if h is not None:
+        for m in HEADER_FIELD.finditer(h.group(1)):
+            if m.group(1) in ('title', 'composer'):
+                out[m.group(1)] = m.group(2)
+    starts = [m.start() for m in re.finditer(r'\\new\s+Staff\b', text)]
+    if not starts:                                      # voce singola o stringa senza Staff
+        out['staves'].append(_parse_staff(text))
+        return out
+    for a, b in zip(starts, _staff_ends(text, starts)):
+        out['staves'].append(_parse_staff(text[a:b]))
+    return out
+
+def read_ly(path):
+    '''Legge un file .ly generato da pycac. OUT: come parse_ly'''
+    with open(path) as f:
+        return parse_ly(f.read())
+
+# ============================================================
+# RICERCA DI SEQUENZE CON VINCOLI (search)
+# Backtracking in profondità con forward checking: i vincoli filtrano in modo
+# vettoriale tutto il dominio (maschera booleana numpy) per la posizione successiva,
+# un ramo senza candidati viene potato prima di scendere.
+# Con workers > 1 i prefissi dei primi livelli sono distribuiti in un pool di processi
+# e le soluzioni arrivano (in ordine di ritrovamento) attraverso una coda.
+
+class Constraint:
+    '''
+    Vincolo per search(). Le sottoclassi definiscono:
+        • __call__(prefix, cand) --> maschera booleana (np.ndarray) dei candidati
+                                     ammessi nella posizione len(prefix)
+        • feasible(prefix, length, domain) --> False se il prefisso non può più essere
+                                     completato (controlla tutte le posizioni future)
+    Vanno definiti a livello di modulo per poter essere inviati ai processi.
+    Anche una funzione f(prefix, cand) --> maschera può essere usata come vincolo.
+    '''
+    def __call__(self, prefix, cand):
+        return np.ones(len(cand), dtype=bool)
+
+    def feasible(self, prefix, length, domain=None):
+        return True
+
+class Intervals(Constraint):
+    '''
+    Intervalli ammessi tra due elementi consecutivi (in semitoni)
+    IN: • allowed (lista di int, es. [1,2,5,7])
+        • signed (bool: se False vale il valore assoluto)
+    '''
+    def __init__(self, allowed, signed=False):
+        self.allowed = np.asarray(allowed)
+        self.signed  = signed
+
+    def __call__(self, prefix, cand):
+        if not prefix:
+            return np.ones(len(cand), dtype=bool)
+        step = cand - prefix[-1]
+        return np.isin(step if self.signed else np.abs(step), self.allowed)
+
+class Bounds(Constraint):
+    '''
+    Ambito come i bounds di random_walk
+    IN: • lo, hi (int, estremi compresi)
+    '''
+    def __init__(self, lo=36, hi=96):
+        self.lo, self.hi = lo, hi
+
+    def __call__(self, prefix, cand):
+        return (cand >= self.lo) & (cand <= self.hi)
+
+class NoRepeatPC(Constraint):
+    '''
+    Nessuna classe di altezze ripetuta entro una finestra di elementi
+    IN: • window (int: 12 = serie dodecafonica se la lunghezza è 12)
+    '''
+    def __init__(self, window=12):
+        self.window = window
+
+    def __call__(self, prefix, cand):
+        recent = [p % 12 for p in prefix[max(0, len(prefix) - self.window + 1):]] if self.window > 1 else []
+        return ~np.isin(cand % 12, recent)
+
+    def feasible(self, prefix, length, domain=None):
+        '''Piccionaia: le posizioni rimaste nella finestra corrente richiedono classi non ancora usate'''
+        if domain is None or self.window <= 1:
+            return True
+        recent = {p % 12 for p in prefix[max(0, len(prefix) - self.window + 1):]}
+        need = min(length - len(prefix), self.window - min(len(prefix), self.window - 1))
+        free = sum(1 for pc in np.unique(np.asarray(domain) % 12).tolist() if pc not in recent)
+        return need <= free
+
+class Density(Constraint):
+    '''
+    Densità ritmica: numero di eventi (valori != 0) per finestra di window elementi,
+    come pulses/steps di euclidean_rhythm. Le finestre sono consecutive e allineate a 0;
+    nell'ultima finestra incompleta vale solo il massimo.
+    IN: • target (int: eventi per finestra)
+        • window (int)
+        • tol (int: scarto ammesso)
+    '''
+    def __init__(self, target, window, tol=0):
+        self.lo, self.hi, self.window = target - tol, target + tol, window
+
+    def __call__(self, prefix, cand):
+        pos = len(prefix)
+        start = pos - pos % self.window
+        ones = sum(1 for p in prefix[start:] if p != 0) + (cand != 0)
+        left = self.window - (pos - start) - 1          # posizioni rimaste nella finestra
+        return (ones <= self.hi) & (ones + left >= self.lo)
+
+def _candidates(prefix, domain, constraints, length):
+    '''Valori del dominio ammessi dopo prefix (vuoto se il ramo va potato)'''
+    mask = None
+    for c in constraints:
+        m = c(prefix, domain)
+        mask = m if mask is None else mask & m
+        if not mask.any():
+            return domain[:0]
+    for c in constraints:
+        if isinstance(c, Constraint):
+            ok = c.feasible(prefix, length, domain)
+        else:
+            feasible = getattr(c, 'feasible', None)
+            ok = feasible is None or feasible(prefix, length)
+        if not ok:
+            return domain[:0]
+    return domain if mask is None else domain[mask]
+
+def _dfs(prefix, domain, constraints, length, rng=None):
+    '''Soluzioni che estendono prefix (generatore di liste), in ordine di dominio o casuale'''
+    prefix = list(prefix)
+    nodes = pruned = 0
+
+    def order(c):
+        return c if rng is None else rng.permutation(c)
+
+    try:
+        if len(prefix) >= length:
+            yield prefix[:length]
+            return
+        stack, idx = [order(_candidates(prefix, domain, constraints, length))], [0]
+        while stack:
+            cands, i = stack[-1], idx[-1]
+            if i == len(cands):                         # livello esaurito: backtrack
+                stack.pop()
+                idx.pop()
+                if stack:
+                    prefix.pop()
+                continue
+            idx[-1] += 1
+            prefix.append(int(cands[i]))
+            nodes += 1
+            if len(prefix) == length:
+                yield list(prefix)
+                prefix.pop()
+                continue
+            nxt = _candidates(prefix, domain, constraints, length)   # forward checking
+            if len(nxt) == 0:
+                pruned += 1
+                prefix.pop()
+                continue
+            stack.append(order(nxt))
+            idx.append(0)
+    finally:
+        _count('nodes', nodes)
+        _count('pruned', pruned)
+
+def _split(prefix, domain, constraints, length, n):
+    '''Espande i primi livelli dell'albero fino ad avere almeno n prefissi'''
+    level = [list(prefix)]
+    while 0 < len(level) < n and len(level[0]) < length - 1:
+        nxt = []
+        for p in level:
+            cands = _candidates(p, domain, constraints, length)
+            if len(cands) == 0 and len(p) > len(prefix):
+                _count('pruned')
+            nxt += [p + [int(c)] for c in cands]
+        level = nxt
+        _count('nodes', len(level))                 # come in _dfs: un nodo per elemento aggiunto
+    return level
+
+_SEARCH = None      # (domain, constraints, length, seed, queue, stop, stats) nei processi del pool
+
+def _search_init(*args):
+    global _SEARCH
+    _SEARCH = args
+    args[4].cancel_join_thread()        # in uscita non attende i dati non letti
+
+def _search_task(k, prefix):
+    '''
+    Esplora un sottoalbero e invia le soluzioni alla coda (a blocchi); None a fine task.
+    OUT: (timers, contatori) del task se instrument() è attivo nel processo principale
+    '''
+    domain, constraints, length, seed, queue, stop, stats = _SEARCH
+    with _collect(stats) as st:
+        _search_subtree(k, prefix, domain, constraints, length, seed, queue, stop)
+    return None if st is None else (st.timers, st.counters)
+
+def _search_subtree(k, prefix, domain, constraints, length, seed, queue, stop):
+    rng = None if seed is None else np.random.default_rng([seed, k])
+
+    def put(item):                      # False se la ricerca è stata interrotta
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    batch, last = [], 0.0
+    sols = _dfs(prefix, domain, constraints, length, rng)
+    for sol in sols:
+        batch.append(sol)
+        now = time.perf_counter()
+        if len(batch) >= 256 or now - last > 0.05:      # la prima subito, poi a blocchi
+            if not put(batch):
+                sols.close()                            # contatori di _dfs
+                return
+            batch, last = [], now
+    if batch and not put(batch):
+        return
+    put(None)
+
+def search(length, domain, constraints=(), workers=None, limit=None, seed=None, prefix=()):
+    '''
+    Cerca sequenze che rispettano tutti i vincoli (backtracking + forward checking).
+    Le soluzioni sono prodotte in modo lazy: la prima arriva appena trovata.
+
+    Args:
+        length (int): Lunghezza delle sequenze
+        domain (iterable): Valori ammessi in ogni posizione (es. range(48, 85), (0, 1))
+        constraints (list): Istanze di Constraint (Intervals, Bounds, NoRepeatPC,
+                            Density, ...) o funzioni f(prefix, cand) --> maschera
+        workers (int): Processi (None o 1 = sequenziale, ordine deterministico)
+        limit (int): Numero massimo di soluzioni (None = tutte)
+        seed (int): Ordine casuale dei candidati (None = ordine del dominio)
+        prefix (list): Inizio fisso della sequenza
+
+    Returns:
+        generatore di liste di int
+
+    Esempio:
+        rules = [Intervals([1,2,3,4,5,7]), Bounds(55, 79), NoRepeatPC(6)]
+        note  = next(search(16, range(48, 85), rules, seed=1))
+        ritmi = list(search(16, (0, 1), [Density(3, 8)], workers=4, limit=10))
+        Staff(note, pattern_to_rhythm(ritmi[0], 8, 16)).out
+    '''
+    domain = np.asarray(list(domain))
+    constraints = list(constraints)
+    if limit is not None and limit <= 0:
+        return
+    t0 = _tic()
+    found = 0
+    try:
+        if workers is None or workers <= 1:
+            rng = None if seed is None else np.random.default_rng(seed)
+            for sol in _dfs(prefix, domain, constraints, length, rng):
+                yield sol
+                found += 1
+                if found == limit:
+                    return
+            return
+
+        import multiprocessing
+        prefixes = _split(prefix, domain, constraints, length, workers * 8)
+        if not prefixes:
+            return
+        queue, stop = multiprocessing.Queue(maxsize=1024), multiprocessing.Event()
+        ex = ProcessPoolExecutor(max_workers=workers, initializer=_search_init,
+                                 initargs=(domain, constraints, length, seed, queue, stop, _STATS is not None))
+        futures = []
+        try:
+            futures = [ex.submit(_search_task, k, p) for k, p in enumerate(prefixes)]
+            done = 0
+            while done < len(futures):
+                try:
+                    batch = queue.get(timeout=0.5)
+                except Empty:                   # controlla errori nei processi
+                    for f in futures:
+                        if f.done() and f.exception() is not None:
+                            raise f.exception()
+                    continue
+                if batch is None:
+                    done += 1
+                    continue
+                for sol in batch:
+                    yield sol
+                    found += 1
+                    if found == limit:
+                        return
+        finally:
+            stop.set()
+            ex.shutdown(wait=True, cancel_futures=True)
+            queue.close()
+            if _STATS is not None:              # nodes/pruned dei processi
+                for f in futures:
+                    if f.done() and not f.cancelled() and f.exception() is None and f.result():
+                        _STATS.merge(*f.result())
+    finally:
+        _toc('search', t0, solutions=found)
+
+# ============================================================
+# ACCORDI IN FORMA COLONNARE (Chords)
+# Le altezze di tutti gli accordi sono in un solo array (pitches) e
+# offsets[i]:offsets[i+1] delimita l'accordo i: ogni operazione lavora
+# sull'intera progressione con numpy. Le pause (-1) e gli spazi (-2)
+# dentro un accordo restano invariati.
+
+PCHS_LY = ['s ', 'r '] + [p + ' ' for p in PCHS]               # indice = midinote + 2
+PCHS_LY = PCHS_LY + [p + '>\n< ' for p in PCHS_LY]              # + ultima nota dell'accordo
+
+class Chords:
+    '''
+    Progressione di accordi (altezze piatte + offset)
+    IN: • chords (lista di accordi [[60,64,67], [62,65,69]], int = accordo di una nota)
+        oppure
+        • pitches (array di midinote) e offsets (array di len(accordi)+1)
+    Ogni operazione restituisce un nuovo Chords; quelle di voicing ordinano le note
+    di ogni accordo dal basso (pause e spazi prima delle note, non modificati).
+    Dentro note di _Voice/Staff vale come len(Chords) accordi (anche in una lista).
+    '''
+    def __init__(self, chords=(), pitches=None, offsets=None):
+        if pitches is None:
+            chords  = [c if type(c) is list else [c] for c in chords]
+            sizes   = [len(c) for c in chords]
+            pitches = [p for c in chords for p in c]
+            offsets = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+        self.pitches = np.asarray(pitches, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.ordered = False            # note di ogni accordo già ordinate
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            a, b, step = i.indices(len(self))
+            if step != 1:
+                return Chords(self.tolist()[i])
+            return Chords(pitches=self.pitches[self.offsets[a]:self.offsets[b]],
+                          offsets=self.offsets[a:b+1] - self.offsets[a])
+        return self.pitches[self.offsets[i]:self.offsets[i+1]].tolist()
+
+    def __repr__(self):
+        return f"Chords({len(self)} accordi, {len(self.pitches)} note)"
+
+    @property
+    def sizes(self):
+        '''Numero di note per accordo'''
+        return np.diff(self.offsets)
+
+    def _ids(self):
+        '''Indice dell'accordo per ogni nota'''
+        return np.repeat(np.arange(len(self)), self.sizes)
+
+    def _new(self, pitches, keep=None):
+        '''Nuovo Chords con le stesse suddivisioni (o solo le note keep), note ordinate'''
+        ids = self._ids()
+        offsets = self.offsets
+        if keep is not None:
+            pitches, ids = pitches[keep], ids[keep]
+            offsets = np.concatenate(([0], np.cumsum(np.bincount(ids, minlength=len(self)))))
+        key = np.sort((ids << 12) | (pitches + 2048))  # un solo sort: accordo, poi altezza
+        out = Chords(pitches=(key & 4095) - 2048, offsets=offsets)
+        out.ordered = True
+        return out
+
+    @staticmethod
+    def _check(p, note, op):
+        '''ValueError se una nota (note = maschera delle note, non pause/spazi) esce da 0..127'''
+        q = p[note]
+        if len(q) and (q.min() < 0 or q.max() > 127):
+            bad = q[(q < 0) | (q > 127)][0]
+            raise ValueError(f"Chords.{op}: nota {bad} fuori dall'ambito midi 0..127")
+        return p
+
+    def _notes(self):
+        '''(prima nota, numero di note) di ogni accordo ordinato, escluse pause e spazi'''
+        rests = np.bincount(self._ids()[self.pitches < 0], minlength=len(self))
+        return self.offsets[:-1] + rests, self.sizes - rests
+
+    def tolist(self):
+        '''Lista di accordi (liste di int) come in mapPitch'''
+        p = self.pitches.tolist()
+        return [p[a:b] for a, b in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+
+    def sort(self):
+        '''Note di ogni accordo dal basso'''
+        return self if self.ordered else self._new(self.pitches)
+
+    def transpose(self, n):
+        '''Traspone di n semitoni (int o un valore per accordo)'''
+        step = np.repeat(np.asarray(n), self.sizes) if np.ndim(n) else n
+        note = self.pitches >= 0
+        p = self._check(np.where(note, self.pitches + step, self.pitches), note, 'transpose')
+        out = Chords(pitches=p, offsets=self.offsets)
+        out.ordered = self.ordered and not np.ndim(n)
+        return out
+
+    def invert(self, k=1):
+        '''
+        Rivolti: k > 0 porta la nota più grave sopra la più acuta (k volte),
+        k < 0 porta la più acuta sotto la più grave
+        '''
+        c = self.sort()
+        first, count = c._notes()
+        multi = count > 1
+        lo, hi = first[multi], (first + count - 1)[multi]
+        for _ in range(abs(k)):
+            p = c.pitches.copy()
+            if k > 0:
+                p[lo] += 12 * ((p[hi] - p[lo]) // 12 + 1)
+            else:
+                p[hi] -= 12 * ((p[hi] - p[lo]) // 12 + 1)
+            c = c._new(self._check(p, p != c.pitches, 'invert'))
+        return c
+
+    def drop(self, n=2):
+        '''Drop-n: la n-esima voce dall'alto scende di un'ottava (accordi con almeno n note)'''
+        c = self.sort()
+        first, count = c._notes()
+        p = c.pitches.copy()
+        moved = (first + count - n)[count >= n]
+        p[moved] -= 12
+        return c._new(self._check(p, moved, 'drop'))
+
+    def spread(self, interval=12):
+        '''Posizione lata: le voci di posto dispari (dal basso) salgono di interval'''
+        c = self.sort()
+        first, _ = c._notes()
+        pos = np.arange(len(c.pitches)) - np.repeat(first, c.sizes)
+        note = pos >= 0
+        return c._new(self._check(c.pitches + interval * (note & (pos % 2 == 1)), note, 'spread'))
+
+    def clamp(self, lo=36, hi=96):
+        '''Riporta per ottave le note nell'ambito lo..hi (come i bounds di random_walk)'''
+        p = self.pitches.copy()
+        note = p >= 0
+        under, over = note & (p < lo), note & (p > hi)
+        p[under] += 12 * -(-(lo - p[under]) // 12)
+        p[over]  -= 12 * -(-(p[over] - hi) // 12)
+        p[note] = np.clip(p[note], lo, hi)          # ambito più stretto di un'ottava
+        return self._new(p)
+
+    def dedup_pc(self):
+        '''Elimina le classi di altezze ripetute nello stesso accordo (resta la più grave)'''
+        c = self.sort()
+        key = np.where(c.pitches >= 0, c._ids() * 12 + c.pitches % 12, -1 - np.arange(len(c.pitches)))
+        _, first = np.unique(key, return_index=True)
+        keep = np.zeros(len(key), dtype=bool)
+        keep[first] = True
+        return c._new(c.pitches, keep)
+
+    def to_ly(self):
+        '''Accordi --> simboli lilypond ('< c e g >'), identici a mapPitch'''
+        if not len(self):
+            return []
+        if len(self.pitches) and (self.pitches.min() < -2 or self.pitches.max() > 127):
+            raise ValueError("Chords.to_ly: altezze fuori da 0..127 (-1 = pausa, -2 = spazio)")
+        sizes = self.sizes
+        if not sizes.all():                             # accordi vuoti: uno per volta
+            names = [PCHS_LY[i] for i in (self.pitches + 2).tolist()]
+            return ['< ' + ''.join(names[a:b]) + '>'
+                    for a, b in zip(self.offsets[:-1].tolist(), self.offsets[1:].tolist())]
+        code = self.pitches + 2
+        code[self.offsets[1:] - 1] += len(PCHS) + 2     # ultima nota: chiude e apre l'accordo
+        text = ''.join([PCHS_LY[i] for i in code.tolist()])
+        return ('< ' + text[:-3]).split('\n')
+
+def _chord_list(a):
+    '''Sostituisce i Chords (anche dentro una lista) con liste di accordi'''
+    if isinstance(a, Chords):
+        return a.tolist()
+    if type(a) is list and any(isinstance(x, Chords) for x in a):
+        out = []
+        for x in a:
+            if isinstance(x, Chords):
+                out.extend(x.tolist())
+            else:
+                out.append(x)
+        return out
+    return a
+
+# ============================================================
+# MODALITÀ WATCH (python -m pycac watch script.py)
+# Un processo di lavoro resta attivo (import e cache caldi) ed esegue lo script
+# a ogni modifica: make_ly / make_file non scrivono né compilano ma riportano
+# il testo lilypond (_CAPTURE). Il processo principale scrive e compila solo
+# i file il cui hash (formato + testo) è cambiato.
+
+def _watch_user_modules(root):
+    '''
+    Moduli dell'utente: file sotto root (la cartella dello script), esclusi
+    pycac e i pacchetti installati (un .venv nella cartella del progetto).
+    OUT: lista di (nome, file)
+    '''
+    import site
+    skip = {os.path.abspath(p) + os.sep for p in (sys.prefix, sys.base_prefix, sys.exec_prefix,
+                                                  *site.getsitepackages(), site.getusersitepackages())}
+    out = []
+    for name, m in list(sys.modules.items()):
+        f = getattr(m, '__file__', None)
+        if not f or name == 'pycac':
+            continue
+        f = os.path.abspath(f)
+        parts = f.split(os.sep)
+        if (f.startswith(root + os.sep) and not any(f.startswith(p) for p in skip)
+                and 'site-packages' not in parts and 'dist-packages' not in parts):
+            out.append((name, f))
+    return out
+
+def _watch_forget(root):
+    '''Rimuove da sys.modules i moduli dell'utente (sotto root) per rileggerli'''
+    for name, _ in _watch_user_modules(root):
+        del sys.modules[name]
+
+def _watch_worker(conn):
+    '''Processo di lavoro: riceve il path dello script, riporta i .ly intercettati'''
+    import runpy
+    import traceback
+    import importlib
+    mod = importlib.import_module('pycac')     # lo stesso modulo importato dagli script
+    while True:
+        script = conn.recv()
+        if script is None:
+            break
+        root = os.path.dirname(os.path.abspath(script))
+        _watch_forget(root)
+        t0 = time.perf_counter()
+        mod._CAPTURE, err = [], None
+        argv, sys.argv = sys.argv, [script]
+        sys.path.insert(0, root)
+        try:
+            runpy.run_path(script, run_name="__main__")
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                err = f"SystemExit: {e.code}"
+        except BaseException:
+            err = traceback.format_exc()
+        finally:
+            out, mod._CAPTURE = mod._CAPTURE, None
+            sys.argv = argv
+            sys.path.remove(root)
+        deps = sorted(f for _, f in _watch_user_modules(root))
+        conn.send({'outputs': out, 'error': err, 'seconds': time.perf_counter() - t0, 'deps': deps})
+
+class _WatchWorker:
+    '''Processo di lavoro caldo per watch(), riavviato se termina'''
+    def __init__(self):
+        import multiprocessing
+        self.mp = multiprocessing
+        self.proc = None
+
+    def run(self, script):
+        if self.proc is None or not self.proc.is_alive():
+            self.conn, child = self.mp.Pipe()
+            self.proc = self.mp.Process(target=_watch_worker, args=(child,), daemon=True)
+            self.proc.start()
+        try:
+            self.conn.send(script)
+            return self.conn.recv()
+        except (EOFError, OSError):
+            self.proc = None
+            return {'outputs': [], 'error': "processo di lavoro terminato", 'seconds': 0.0, 'deps': []}
+
+    def close(self):
+        if self.proc is not None and self.proc.is_alive():
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+            self.proc.join(1)
+            if self.proc.is_alive():
+                self.proc.terminate()
+
+def _watch_print(report):
+    '''Riepilogo di un'esecuzione di watch()'''
+    files = report['files']
+    done = [f for f in files if f['rendered']]
+    print(f"[watch] #{report['run']}: {len(files)} file, {sum(f['changed'] for f in files)} cambiati, "
+          f"{len(done)} compilati in {report['seconds']:.2f} s (script {report['generate']:.2f} s)")
+    for f in done:
+        state = "ok" if f['returncode'] == 0 else f"errore {f['returncode']}"
+        print(f"[watch]   {f['file']}.{f['format']}: {state} ({f['seconds']:.2f} s)")
+    if report['error']:
+        print(report['error'], file=sys.stderr)
+
+def watch(script, inputs=(), interval=0.25, debounce=0.3, runs=None, callback=None):
+    '''
+    Riesegue lo script a ogni modifica (sua, dei file inputs o dei moduli
+    importati dalla sua cartella) e ricompila solo i .ly cambiati.
+
+    Args:
+        script (str): Script python che chiama make_file / make_ly
+        inputs (list): Altri file da controllare (anche pattern glob, es. "dati/*.json")
+        interval (float): Intervallo di polling in secondi
+        debounce (float): Attesa senza nuove modifiche prima di eseguire (salvataggi ravvicinati)
+        runs (int): Numero massimo di esecuzioni (None = fino a Ctrl-C)
+        callback (callable): callback(report) dopo ogni esecuzione (default: stampa un riepilogo)
+
+    Returns:
+        list: report di ogni esecuzione {'run', 'seconds', 'generate', 'error',
+              'files': [{'file', 'format', 'changed', 'rendered', 'returncode', 'seconds'}]}
+
+    Esempio:
+        watch("pezzo.py", inputs=["serie.json"])       # python -m pycac watch pezzo.py -i serie.json
+    '''
+    script = os.path.abspath(script)
+    deps, hashes, history = [], {}, []
+    callback = callback or _watch_print
+
+    def snapshot():
+        files = [script] + [f for p in inputs for f in sorted(glob.glob(p))] + deps
+        snap = {}
+        for f in files:
+            try:
+                st = os.stat(f)
+                snap[f] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                snap[f] = None
+        return snap
+
+    def render(item):
+        t0 = time.perf_counter()
+        item['returncode'], _, item['log'] = _lilypond(item['file'], item['format'], quiet=True)
+        item['seconds'] = time.perf_counter() - t0
+        return item
+
+    worker = _WatchWorker()
+    state = None
+    try:
+        while runs is None or len(history) < runs:
+            snap = snapshot()
+            if snap == state:
+                time.sleep(interval)
+                continue
+            if state is not None:                       # debounce: attende che i file siano stabili
+                while True:
+                    time.sleep(debounce)
+                    again = snapshot()
+                    if again == snap:
+                        break
+                    snap = again
+            state = snap
+
+            t0 = time.perf_counter()
+            res = worker.run(script)
+            deps[:] = [d for d in res['deps'] if d != script]
+            state.update((k, v) for k, v in snapshot().items() if k not in state)
+            files, todo = [], []
+            for out in res['outputs']:
+                text = out['text']
+                if text is None:                        # .ly scritto dallo script (make_project)
+                    try:
+                        with open(out['file'] + ".ly") as f:
+                            text = f.read()
+                    except OSError:
+                        text = ""
+                key = hashlib.sha256(f"{out['format']}\n{text}".encode()).hexdigest()
+                item = {'file': out['file'], 'format': out['format'], 'changed': hashes.get(out['file']) != key,
+                        'rendered': False, 'returncode': None, 'seconds': 0.0}
+                if item['changed'] and out['text'] is not None:
+                    with open(out['file'] + ".ly", "w") as f:
+                        f.write(text)
+                if out['render'] and (item['changed'] or not _has_output(out['file'], out['format'])):
+                    item['rendered'] = True
+                    todo.append(item)
+                hashes[out['file']] = key
+                files.append(item)
+            if todo:
+                with ThreadPoolExecutor(max_workers=len(todo)) as ex:
+                    list(ex.map(render, todo))
+                for item in todo:
+                    if item['returncode'] != 0:
+                        hashes.pop(item['file'], None)  # ricompila alla prossima esecuzione
+                    item.pop('log')
+            report = {'run': len(history) + 1, 'seconds': time.perf_counter() - t0,
+                      'generate': res['seconds'], 'error': res['error'], 'files': files}
+            history.append(report)
+            callback(report)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+    return history
+
+# ============================================================
+# RENDER IN BATCH DA SPECIFICHE JSON (python -m pycac render)
+# Una specifica è un dict:
+#   {"id": "job1", "filename": "score", "format": "pdf",
+#    "title": ..., "composer": ..., "staff_size": ..., "size": "a4" | [w, h], "margins": [...],
+#    "layout": {"nbar": 2, "time_num": 4, "time_den": 4},          # opzionale, per tutti i righi
+#    "staves": [{"note": [...], "dur": [...], "vel": [...], "exp": [...],
+#                "clef": "bass", "key": ["c", "major"], "i_name": ..., "layout": {...}},
+#               {"voices": [{"note": ..., "dur": ...}, {...}], ...}]}     # più voci
+
+STAFF_KEYS = ('note', 'dur', 'vel', 'exp', 'key', 't_sig', 'clef', 'i_name', 'i_short', 'i_midi', 'compact')
+SCORE_KEYS = ('staff_size', 'indent', 's_indent', 'title', 'composer', 'size', 'margins', 'format', 'version')
+CACHE_DIR  = os.environ.get("PYCAC_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "pycac"))
+
+def load_specs(paths):
+    '''
+    Legge specifiche da file .json (oggetto o lista) o .jsonl (un oggetto per riga).
+    OUT: generatore di dict
+    '''
+    for path in paths:
+        with open(path) as f:
+            if path.endswith(".jsonl"):
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+            else:
+                data = json.load(f)
+                yield from (data if type(data) == list else [data])
+
+def _spec_exp(exp):
+    '''JSON non ha tuple: più espressioni sulla stessa nota arrivano come lista'''
+    if type(exp) == list:
+        return [tuple(e) if type(e) == list else e for e in exp]
+    return exp
+
+def spec_staff(spec, layout=None, compact=False):
+    '''Specifica di un rigo (dict) --> stringa lilypond di Staff'''
+    args = {k: spec[k] for k in STAFF_KEYS if k in spec}
+    args.setdefault('compact', compact)
+    if 'exp' in args:
+        args['exp'] = _spec_exp(args['exp'])
+    if 'voices' in spec:                                # più voci --> tuple
+        for k in ('note', 'dur', 'vel', 'exp'):
+            vals = tuple(_spec_exp(v.get(k)) if k == 'exp' else v.get(k) for v in spec['voices'])
+            if k == 'note' or any(v is not None for v in vals):
+                args[k] = vals
+    out = Staff(**args).out
+    layout = spec.get('layout', layout)
+    if layout:
+        out = layout_uniforme(out, **layout)
+    return out
+
+def _spec_filename(name):
+    '''Nome di file di una specifica: relativo e dentro la cartella di output'''
+    parts = re.split(r'[\\/]', name)
+    if not name or os.path.isabs(name) or os.path.splitdrive(name)[0] or '..' in parts:
+        raise ValueError(f"filename non valido: {name!r} (percorso relativo senza '..')")
+    return name
+
+def spec_score(spec, out_dir=".", compact=False):
+    '''Specifica di una partitura (dict) --> Score'''
+    filename = _spec_filename(spec['filename'])
+    args = {k: spec[k] for k in SCORE_KEYS if k in spec}
+    if type(args.get('size')) == list:
+        args['size'] = tuple(args['size'])
+    compact = spec.get('compact', compact)
+    staves = tuple(spec_staff(s, spec.get('layout'), compact) for s in spec['staves'])
+    return Score(staves, filename=os.path.join(out_dir, filename), **args)
+
+def _outputs(filename):
+    '''File generati da lilypond per filename (escluso il .ly)'''
+    return sorted(f for f in glob.glob(glob.escape(filename) + ".*") + glob.glob(glob.escape(filename) + "-page*")
+                  if not f.endswith(".ly"))
+
+def _has_output(filename, format):
+    '''True se esiste il file del formato richiesto (filename.png o filename-page1.png, ...)'''
+    return (os.path.exists(f"{filename}.{format}")
+            or bool(glob.glob(glob.escape(filename) + f"-page*.{format}")))
+
+def _render_cached(score, cache_dir=None):
+    '''
+    Scrive il .ly e lo compila, oppure copia i file dalla cache se lo stesso
+    codice lilypond è già stato compilato. OUT: (returncode, log, da cache)
+    '''
+    h = hashlib.sha256(f"{score.format}\n".encode())
+    score._write(h)                                 # scrive il .ly e calcola la chiave
+    if cache_dir is None:
+        rc, _, log = _lilypond(score.filename, score.format, quiet=True)
+        return rc, log, False
+    key = h.hexdigest()
+    entry = os.path.join(cache_dir, key)
+    base = os.path.basename(score.filename)
+    if os.path.isdir(entry):
+        _count('cache_hits')
+        for f in os.listdir(entry):                 # in cache: 'out' + estensione
+            shutil.copyfile(os.path.join(entry, f), score.filename + f[3:])
+        return 0, "", True
+    _count('cache_misses')
+    rc, _, log = _lilypond(score.filename, score.format, quiet=True)
+    if rc == 0:
+        tmp = f"{entry}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp, exist_ok=True)
+        for f in _outputs(score.filename):
+            shutil.copyfile(f, os.path.join(tmp, "out" + os.path.basename(f)[len(base):]))
+        try:
+            os.rename(tmp, entry)
+        except OSError:                     # già in cache (job identico in parallelo)
+            shutil.rmtree(tmp, ignore_errors=True)
+    return rc, log, False
+
+def render_specs(specs, out_dir=".", workers=None, cache_dir=CACHE_DIR, render=True, compact=False):
+    '''
+    Costruisce le partiture dalle specifiche (in questo processo) e le compila
+    con un pool di thread (un processo lilypond per job), usando la cache.
+
+    Args:
+        specs (iterable): Specifiche (dict), vedi load_specs()
+        out_dir (str): Cartella di output
+        workers (int): Compilazioni parallele (default os.cpu_count())
+        cache_dir (str): Cartella della cache (None = senza cache)
+        render (bool): Se False scrive solo i file .ly
+        compact (bool): Compattazione di durate e dinamiche ripetute (default degli Staff)
+
+    Returns:
+        list: manifest, un dict per job {'id', 'ly', 'outputs', 'cached',
+              'returncode', 'seconds', 'error'}
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def job(item):
+        n, spec = item
+        t0 = time.perf_counter()
+        res = {'id': spec.get('id', n), 'ly': None, 'outputs': [],
+               'cached': False, 'returncode': None, 'seconds': 0.0, 'error': None}
+        try:
+            spec = dict(spec, filename=spec.get('filename', f"job{n:05d}"))
+            with lock:                                  # costruzione nel processo principale
+                score = spec_score(spec, out_dir, compact)
+            res['ly'] = score.filename + ".ly"
+            if render:
+                rc, log, res['cached'] = _render_cached(score, cache_dir)
+                res['returncode'] = rc
+                res['outputs'] = _outputs(score.filename)
+                if rc != 0:
+                    res['error'] = log[-2000:]
+            else:
+                score.make_ly
+        except Exception as e:
+            res['error'] = f"{type(e).__name__}: {e}"
+        res['seconds'] = time.perf_counter() - t0
+        return res
+
+    lock = threading.Lock()    # la costruzione è python puro: un thread alla volta
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as ex:
+        return list(ex.map(job, enumerate(specs)))
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="python -m pycac", description="pycac da riga di comando")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("render", help="compila specifiche JSON/JSONL di partiture")
+    r.add_argument("specs", nargs="+", help="file .json (oggetto o lista) o .jsonl")
+    r.add_argument("--out-dir", default=".", help="cartella di output (default .)")
+    r.add_argument("--workers", type=int, default=None, help="compilazioni lilypond parallele")
+    r.add_argument("--cache", default=CACHE_DIR, help=f"cartella della cache (default {CACHE_DIR})")
+    r.add_argument("--no-cache", action="store_true", help="non usa la cache")
+    r.add_argument("--no-render", action="store_true", help="scrive solo i file .ly")
+    r.add_argument("--compact", action="store_true", help="omette durate e dinamiche ripetute")
+    r.add_argument("--manifest", default=None, help="file del manifest (default OUT_DIR/manifest.json)")
+    w = sub.add_parser("watch", help="riesegue uno script a ogni modifica e ricompila i .ly cambiati")
+    w.add_argument("script", help="script python che chiama make_file / make_ly")
+    w.add_argument("-i", "--input", action="append", default=[], help="altri file da controllare (anche glob)")
+    w.add_argument("--interval", type=float, default=0.25, help="polling in secondi (default 0.25)")
+    w.add_argument("--debounce", type=float, default=0.3, help="attesa dopo l'ultima modifica (default 0.3)")
+    w.add_argument("--runs", type=int, default=None, help="numero massimo di esecuzioni")
+    args = p.parse_args(argv)
+
+    if args.cmd == "watch":
+        history = watch(args.script, args.input, args.interval, args.debounce, args.runs)
+        return 1 if history and history[-1]['error'] else 0
+
+    if args.cmd == "render":
+        manifest = render_specs(load_specs(args.specs), args.out_dir, args.workers,
+                                None if args.no_cache else args.cache, not args.no_render, args.compact)
+        path = args.manifest or os.path.join(args.out_dir, "manifest.json")
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=1)
+        failed = sum(1 for m in manifest if m['error'] is not None)
+        print(f"{len(manifest)} job, {sum(m['cached'] for m in manifest)} da cache, {failed} errori --> {path}")
+        return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
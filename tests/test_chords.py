@@ -0,0 +1,36 @@
+import pytest
+
+import pycac
+
+
+def test_voicings():
+    c = pycac.Chords([[67, 60, 64], [62, -1, 65, 69], 72])
+    assert c.sort().tolist() == [[60, 64, 67], [-1, 62, 65, 69], [72]]
+    assert c.invert().tolist() == [[64, 67, 72], [-1, 65, 69, 74], [72]]
+    assert c.invert(-1).tolist() == [[55, 60, 64], [-1, 57, 62, 65], [72]]
+    assert c.drop(2).tolist() == [[52, 60, 67], [-1, 53, 62, 69], [72]]
+    assert c.transpose(2).tolist() == [[69, 62, 66], [64, -1, 67, 71], [74]]
+    assert c.to_ly() == pycac.mapPitch(c.tolist())
+
+
+@pytest.mark.parametrize("op, chords", [
+    (lambda c: c.transpose(10), [[60, 120]]),
+    (lambda c: c.transpose(-61), [[60, 64]]),
+    (lambda c: c.transpose([0, 20]), [[60], [100, 110]]),
+    (lambda c: c.invert(), [[60, 124]]),
+    (lambda c: c.invert(-1), [[3, 7]]),
+    (lambda c: c.drop(2), [[5, 9, 12]]),
+    (lambda c: c.spread(24), [[100, 110]]),
+    (lambda c: c.to_ly(), [[60, 128]]),
+    (lambda c: c.to_ly(), [[-3, 60]]),
+])
+def test_range_rejected(op, chords):
+    with pytest.raises(ValueError):
+        op(pycac.Chords(chords))
+
+
+def test_rests_not_moved():
+    c = pycac.Chords([[-1, -2, 0]])
+    assert c.transpose(127).tolist() == [[-1, -2, 127]]
+    with pytest.raises(ValueError):
+        c.transpose(-1)
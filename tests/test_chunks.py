@@ -0,0 +1,60 @@
+import shutil
+from fractions import Fraction
+
+import pytest
+
+import pycac
+
+
+def _totals(path):
+    '''Durate totali delle voci (non vuote) di tutti gli Staff di un file .ly'''
+    body = open(path).read().split("\\new StaffGroup", 1)[1].split("\\layout", 1)[0]
+    return {v[4] for v in pycac._split_staff(body)[1]['voices'] if v[0]}
+
+
+def _chunks(tmp_path, monkeypatch, staves, n):
+    monkeypatch.setattr(pycac, "_lilypond", lambda *a, **k: (1, 0.0, ""))
+    sc = pycac.Score(staves, filename=str(tmp_path / "s"))
+    return sc.make_chunks(n=n)['chunks']
+
+
+def test_cut_waits_for_common_bar_line(tmp_path, monkeypatch):
+    a = pycac.Staff([60] * 16, [4] * 16).out
+    b = pycac.Staff([67] * 6, ['2.'] * 4 + [2, 2]).out          # bar 3 crosses the bar line
+    chunks = _chunks(tmp_path, monkeypatch, (a, b), 2)
+    assert [c['bars'] for c in chunks] == [(1, 3), (4, 4)]
+    for c in chunks:
+        first, end = c['bars']
+        assert _totals(c['file'] + ".ly") == {Fraction(end - first + 1)}
+
+
+def test_tuplet_start_restates_dynamic_and_duration(tmp_path, monkeypatch):
+    a = pycac.Staff([60] * 8 + [62, 64, 65], [8] * 8 + [[4, [1, 1, 1]], 4, 2], [50], compact=True).out
+    assert "\\tuplet 3/2 { d' e'" in a                    # nessuna durata né dinamica
+    chunks = _chunks(tmp_path, monkeypatch, (a,), 2)
+    assert "\\tuplet 3/2 { d'8\\mp e'" in open(chunks[1]['file'] + ".ly").read()
+
+
+def test_tied_duration_repeats_last_segment():
+    times = pycac._voice_scan("c'4~16 d' e'")[0]
+    assert times == [0, Fraction(5, 16), Fraction(6, 16)]
+
+
+@pytest.mark.skipif(shutil.which("lilypond") is None, reason="lilypond non installato")
+def test_midi_merge_matches_full_render(tmp_path):
+    a = pycac.Staff([60] * 12 + [-1] * 4, [4] * 16, [40, 90]).out
+    b = pycac.Staff([67, 69, 71], [4, [4, [1, 1, 1]], 2, 4] * 4).out
+    sc = pycac.Score((a, b), filename=str(tmp_path / "ch"))
+    res = sc.make_chunks(n=3)
+    full = pycac.Score((a, b), filename=str(tmp_path / "full"))
+    full.make_ly
+    assert pycac._lilypond(full.filename, "pdf", quiet=True)[0] == 0
+
+    def notes(path):
+        div, tracks = pycac._midi_read(path)
+        return [sorted((t * 384 // div, e[1], e[2] if e[0] & 0xF0 == 0x90 else 0)
+                       for t, e in events if len(e) == 3 and e[0] & 0xF0 in (0x80, 0x90))
+                for events, _ in tracks]
+
+    assert [c['returncode'] for c in res['chunks']] == [0] * len(res['chunks'])
+    assert notes(res['midi']) == notes(pycac._midi_path(full.filename))
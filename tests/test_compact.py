@@ -0,0 +1,61 @@
+import random
+import shutil
+
+import pytest
+
+import pycac
+
+
+def _material(seed, n=40):
+    rng = random.Random(seed)
+    note = [rng.choice([60, 62, [60, 64, 67], -1]) for _ in range(n)]
+    dur = [rng.choice([4, 4, 8, 8, 16, 2, '8.', '4~16', [4, [1, 1, 1]], [2, [3, 5]]]) for _ in range(n)]
+    vel = [rng.choice([60, 60, 80]) for _ in range(n)]
+    exp = [rng.choice([0, 0, '>', '.', 'cresc', 'end']) for _ in range(n)]
+    return note, dur, vel, exp
+
+
+def _timing(staff):
+    '''Tempi di inizio e durata totale di ogni voce (scanner di make_chunks)'''
+    out = []
+    for a, b in pycac._staff_spans(staff):
+        times, _, _, _, total, _, _ = pycac._voice_scan(staff[a:b])
+        out.append((times, total))
+    return out
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_compact_keeps_timing(seed):
+    m = _material(seed)
+    plain, comp = pycac.Staff(*m).out, pycac.Staff(*m, compact=True).out
+    assert len(comp) <= len(plain)
+    assert _timing(plain) == _timing(comp)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_compact_keeps_layout_breaks(seed):
+    m = _material(seed, 80)
+    plain, comp = pycac.Staff(*m).out, pycac.Staff(*m, compact=True).out
+    for nbar in (1, 2):
+        a = pycac.layout_uniforme(plain, nbar=nbar).count("\\break")
+        assert a == pycac.layout_uniforme(comp, nbar=nbar).count("\\break")
+
+
+def test_layout_ignores_header_and_counts_ties():
+    st = pycac.Staff([60, 62, 64, 65] * 4, [4] * 16, i_name="Violino 2", compact=True).out
+    assert pycac.layout_uniforme(st, nbar=1).count("\\break") == 4
+    st = pycac.Staff([60, 62, 64], ['2~8', 0, 0, 0, 4]).out          # 5/8 + 1/8 + 1/8 + 1/8 = 1
+    out = pycac.layout_uniforme(st, nbar=1)
+    assert out.count("\\break") == 1 and out.index("\\break") > out.index("e'")
+
+
+@pytest.mark.skipif(shutil.which("lilypond") is None, reason="lilypond non installato")
+def test_compact_same_midi(tmp_path):
+    m = _material(1)
+    files = []
+    for name, compact in (("plain", False), ("comp", True)):
+        sc = pycac.Score(pycac.Staff(*m, compact=compact).out, filename=str(tmp_path / name))
+        sc.make_ly
+        assert pycac._lilypond(sc.filename, "pdf", quiet=True)[0] == 0
+        files.append(pycac._midi_path(sc.filename))
+    assert pycac._midi_read(files[0]) == pycac._midi_read(files[1])
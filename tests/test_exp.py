@@ -0,0 +1,31 @@
+import numpy as np
+
+import pycac
+
+
+def test_artic_order_is_fixed():
+    # le maschere salvate dipendono da quest'ordine
+    assert pycac.ARTIC[:6] == ('>', '^', '!', '.', '_', '-')
+    assert pycac.exp_mask('.') == 8 and pycac.exp_mask('cresc') == 1 << 14
+    assert set(pycac.ARTIC) == {k for k in pycac.EXPR if k not in (00, '')}
+
+
+def test_lists_as_groups():
+    assert pycac.mapExp([['.', '-'], ('.', '-'), '>']) == ['-.--', '-.--', '->']
+    assert pycac.exp_masks(['>', ['.', '-'], ('.', '-')]).tolist() == [1, 40, 40]
+    assert pycac.exp_keys(pycac.exp_mask(['.', '-'])) == ('.', '-')
+    lists = pycac.Staff([60, 62, 64], [4], exp=['>', ['.', '-'], 0]).out
+    assert lists == pycac.Staff([60, 62, 64], [4], exp=['>', ('.', '-'), 0]).out
+
+
+def test_masks_and_keys_agree():
+    masks = pycac.exp_masks(['>', ('.', 'cresc'), 00]) | pycac.exp_mask('end')
+    assert pycac.mapExp(masks) == pycac.mapExp([('>', 'end'), ('.', 'cresc', 'end'), 'end'])
+    assert isinstance(masks, np.ndarray)
+
+
+def test_spec_lists():
+    spec = {'note': [60, 62], 'exp': [['.', '>'], 0]}
+    assert pycac.spec_staff(spec) == pycac.Staff([60, 62], exp=[('.', '>'), 0]).out
+    spec = {'voices': [{'note': [60, 62], 'exp': [['.', '>'], 0]}, {'note': [50]}]}
+    assert pycac.spec_staff(spec) == pycac.Staff(([60, 62], [50]), exp=([('.', '>'), 0], None)).out
@@ -0,0 +1,25 @@
+import tracemalloc
+
+import pycac
+
+
+def test_memory_keeps_caller_session():
+    tracemalloc.start()
+    try:
+        with pycac.instrument(memory=True) as st:
+            pycac.Staff([60, 62, 64], [4]).out
+        assert tracemalloc.is_tracing()
+        assert st.memory[0] > 0
+    finally:
+        tracemalloc.stop()
+    with pycac.instrument(memory=True):
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+
+
+def test_lilypond_missing_is_timed(monkeypatch, tmp_path):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    with pycac.instrument() as st:
+        rc, _, _ = pycac._lilypond(str(tmp_path / "x"), quiet=True)
+    assert rc == 127
+    assert 'lilypond' in st.as_dict['timers']
@@ -0,0 +1,43 @@
+import copy
+
+import numpy as np
+import pytest
+
+import pycac
+
+STAVES = [
+    {'note': [60, [60, 64, 67], -1, 62], 'dur': [4, '8.', [4, [1, 1, 1]], '4~16', 'mod'],
+     'vel': [60, 80.5, 70], 'exp': ['>', ('.', '-'), 0, 'cresc'], 'clef': 'treble', 'i_name': "Violino 1"},
+    {'note': ([48, 50, 'zero'], [55, -1]), 'dur': ([2, 4], [[2, [3, 5]], 8]),
+     'vel': (64, None), 'exp': None, 'clef': 'bass'},
+    {'note': [72] * 5, 'dur': 16},
+]
+
+
+@pytest.mark.parametrize("name, compressed", [("arch.npz", False), ("arch.npz", True), ("arch", False)])
+def test_round_trip(tmp_path, name, compressed):
+    path = pycac.save_material(str(tmp_path / name), STAVES, compressed=compressed)
+    m = pycac.load_material(path)
+    assert len(m) == len(STAVES)
+    for i, staff in enumerate(STAVES):
+        assert m.staff(i).out == pycac.Staff(**copy.deepcopy(staff)).out
+    assert m[1]['note'] == ([48, 50, 'zero'], [55, -1])
+    assert m[0]['dur'] == STAVES[0]['dur']
+    assert m[-1] == m[2]
+
+
+def test_directory_is_memory_mapped(tmp_path):
+    path = pycac.save_material(str(tmp_path / "arch"), STAVES)
+    m = pycac.load_material(path)
+    m[0]
+    assert isinstance(m._cols['pitch'], np.memmap)
+    assert 'dur_sub' in m._cols and 'exp_code' in m._cols
+
+
+def test_staff_and_score_objects(tmp_path):
+    st = pycac.Staff(**copy.deepcopy(STAVES[0]))
+    path = pycac.save_material(str(tmp_path / "one.npz"), st)
+    assert pycac.load_material(path).staff(0).out == st.out
+    sc = pycac.Score.from_specs(copy.deepcopy(STAVES))
+    path = pycac.save_material(str(tmp_path / "score"), sc)
+    assert pycac.load_material(path).score().out == sc.out
@@ -0,0 +1,16 @@
+import pycac
+
+
+def _onsets(staff, tempo=60):
+    return [round(t, 6) for t, msg in pycac.midi_events(staff, tempo) if msg[0] & 0xF0 == 0x90]
+
+
+def test_durationless_note_after_split_duration():
+    # [2, [3, 5]] --> '8.' '4~16': le note senza durata valgono 16 come in lilypond
+    st = pycac.Staff(note=[60, 62, 64, 65, 67, 69], dur=[[2, [3, 5]], 0, 0, 8, 4])
+    assert _onsets(st) == [0, 0.75, 2.0, 2.25, 2.5, 3.0]
+
+
+def test_durationless_note_after_tuplet():
+    st = pycac.Staff(note=[60, 62, 64, 65], dur=[[4, [1, 1, 1]], 0])
+    assert _onsets(st) == [round(x, 6) for x in (0, 1 / 3, 2 / 3, 1.0)]
@@ -0,0 +1,31 @@
+import pytest
+
+import pycac
+from test_compact import _material
+
+
+@pytest.mark.parametrize("seed", range(30))
+@pytest.mark.parametrize("compact", (False, True))
+def test_staff_round_trip(seed, compact):
+    src = pycac.Staff(*_material(seed), compact=compact).out
+    staff = pycac.parse_ly(src)['staves'][0]
+    assert pycac.Staff(**staff).out == src
+
+
+def test_compact_tuplet_flag():
+    src = pycac.Staff([60, 62, 64, 65], [[4, [1, 1, 1]], 4], compact=True).out
+    staff = pycac.parse_ly(src)['staves'][0]
+    assert staff['compact'] is True
+    assert pycac.Staff(**staff).out == src
+    assert 'compact' not in pycac.parse_ly(pycac.Staff([60, 62], [4, 4], compact=True).out)['staves'][0]
+
+
+@pytest.mark.parametrize("compact", (False, True))
+def test_score_round_trip(compact):
+    a, b, c = _material(1), _material(2), _material(3)
+    staves = (pycac.Staff(*a, i_name="Violino 1", compact=compact).out,
+              pycac.Staff(*zip(b, c), clef="bass", i_name="Viola", compact=compact).out)
+    src = pycac.Score(staves, title="Prova", composer="X").out
+    parsed = pycac.parse_ly(src)
+    assert (parsed['title'], parsed['composer']) == ("Prova", "X")
+    assert tuple(pycac.Staff(**s).out for s in parsed['staves']) == staves
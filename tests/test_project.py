@@ -0,0 +1,33 @@
+import os
+
+import pycac
+
+
+def _fake_lilypond(calls):
+    def run(filename, format="pdf", quiet=False):
+        calls.append(filename)
+        for ext in (format, "midi"):
+            open(f"{filename}.{ext}", "w").close()
+        return 0, 0.0, ""
+    return run
+
+
+def test_project_skips_only_when_requested_output_exists(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(pycac, "_lilypond", _fake_lilypond(calls))
+    sc = pycac.Score((pycac.Staff([60, 62]).out,), filename="p")
+    d = str(tmp_path / "p")
+    assert sc.make_project(d)['compiled']
+    assert not sc.make_project(d)['compiled']
+    os.remove(os.path.join(d, "p.pdf"))                 # resta il .midi
+    assert sc.make_project(d)['compiled']
+    assert len(calls) == 2
+
+
+def test_project_recompiles_changed_fragment(tmp_path, monkeypatch):
+    monkeypatch.setattr(pycac, "_lilypond", _fake_lilypond([]))
+    d = str(tmp_path / "p")
+    a, b = pycac.Staff([60]).out, pycac.Staff([64]).out
+    pycac.Score((a, b), filename="p").make_project(d)
+    res = pycac.Score((a, pycac.Staff([65]).out), filename="p").make_project(d)
+    assert res['changed'] == [1] and res['compiled']
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+import pycac
+
+
+@pytest.mark.parametrize("name", ["../x", "a/../../x", "a\\..\\x", "/tmp/x", ""])
+def test_spec_filename_rejected(tmp_path, name):
+    out = tmp_path / "out"
+    manifest = pycac.render_specs([{'filename': name, 'staves': [{'note': [60]}]}],
+                                  str(out), workers=1, cache_dir=None, render=False)
+    assert manifest[0]['ly'] is None and manifest[0]['error'].startswith("ValueError")
+    assert not (tmp_path / "x.ly").exists()
+
+
+def test_specs_write_ly(tmp_path):
+    specs = [{'staves': [{'note': [60, 62], 'exp': [['.', '>'], 0]}]},
+             {'filename': "due", 'staves': [{'voices': [{'note': [60]}, {'note': [48]}]}]}]
+    manifest = pycac.render_specs(specs, str(tmp_path), workers=1, cache_dir=None, render=False)
+    assert [m['error'] for m in manifest] == [None, None]
+    assert [os.path.basename(m['ly']) for m in manifest] == ["job00000.ly", "due.ly"]
+    assert all(os.path.exists(m['ly']) for m in manifest)
@@ -0,0 +1,25 @@
+import time
+
+import pycac
+
+
+def test_norepeatpc_pigeonhole_prunes_at_root():
+    t0 = time.perf_counter()
+    assert list(pycac.search(13, range(60, 72), [pycac.NoRepeatPC(13)])) == []
+    assert time.perf_counter() - t0 < 1.0
+
+
+def test_norepeatpc_solutions_are_valid():
+    rules = [pycac.NoRepeatPC(12), pycac.Intervals([1, 2, 3, 4, 5, 7])]
+    for row in pycac.search(12, range(60, 72), rules, limit=20):
+        assert len({p % 12 for p in row}) == 12
+
+
+def test_parallel_counts_split_nodes():
+    rules = [pycac.Intervals([1, 2, 3, 4, 5, 7]), pycac.Bounds(55, 79), pycac.NoRepeatPC(6)]
+    counts = []
+    for workers in (None, 2):
+        with pycac.instrument() as st:
+            n = sum(1 for _ in pycac.search(4, range(55, 68), rules, workers=workers))
+        counts.append((n, st.counters['nodes']))
+    assert counts[0] == counts[1]